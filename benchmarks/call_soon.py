@@ -0,0 +1,59 @@
+# Measure the time and memory needed to schedule and run callbacks with
+# EventLoop.call_soon.
+#
+# Usage: python benchmarks/call_soon.py [count]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import evergreen
+
+
+def noop(*args, **kw):
+    pass
+
+
+def bench_schedule(loop, count):
+    t0 = time.time()
+    for x in range(count):
+        loop.call_soon(noop, x)
+    t1 = time.time()
+    loop.run()
+    t2 = time.time()
+    return t1 - t0, t2 - t1
+
+
+def bench_memory(loop, count):
+    tracemalloc.start()
+    handlers = [loop.call_soon(noop, x) for x in range(count)]
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del handlers
+    return size
+
+
+def main():
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 200000)
+
+    loop = evergreen.EventLoop()
+    schedule, run = bench_schedule(loop, count)
+    loop.destroy()
+    print('call_soon: {:.3f} us per call'.format(schedule * 1e6 / count))
+    print('dispatch:  {:.3f} us per callback'.format(run * 1e6 / count))
+
+    if tracemalloc is not None:
+        loop = evergreen.EventLoop()
+        size = bench_memory(loop, count)
+        loop.destroy()
+        print('memory:    {:.1f} bytes per pending callback'.format(float(size) / count))
+
+
+if __name__ == '__main__':
+    main()
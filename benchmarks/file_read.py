@@ -0,0 +1,79 @@
+# Measure how file reads affect the responsiveness of the loop. A ticker task asks
+# to be woken up every millisecond while other tasks read a file with blocking
+# reads, with evergreen.io.file reads, and with File.iter_chunks. The throughput
+# and the worst ticker delay are reported.
+#
+# Usage: python benchmarks/file_read.py [megabytes] [readers]
+
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import file
+
+CHUNK_SIZE = 256*1024
+
+
+def run(path, nbytes, nreaders, read):
+    loop = evergreen.EventLoop()
+    stats = {'running': nreaders, 'max_delay': 0.0}
+
+    def ticker():
+        while stats['running']:
+            t0 = time.time()
+            evergreen.sleep(0.001)
+            stats['max_delay'] = max(stats['max_delay'], time.time() - t0 - 0.001)
+
+    def reader():
+        read(path)
+        stats['running'] -= 1
+
+    evergreen.spawn(ticker)
+    for x in range(nreaders):
+        evergreen.spawn(reader)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    return nbytes * nreaders / elapsed / (1024*1024), stats['max_delay'] * 1000
+
+
+def blocking_read(path):
+    with open(path, 'rb') as f:
+        while f.read(CHUNK_SIZE):
+            pass
+
+
+def green_read(path):
+    with file.File(path) as f:
+        while f.read(CHUNK_SIZE):
+            pass
+
+
+def green_iter_chunks(path):
+    with file.File(path) as f:
+        for chunk in f.iter_chunks(CHUNK_SIZE):
+            pass
+
+
+def main():
+    mb = int(sys.argv[1] if len(sys.argv) > 1 else 256)
+    nreaders = int(sys.argv[2] if len(sys.argv) > 2 else 4)
+    fd, path = tempfile.mkstemp()
+    chunk = os.urandom(1024*1024)
+    for x in range(mb):
+        os.write(fd, chunk)
+    os.close(fd)
+    try:
+        for name, read in (('blocking', blocking_read), ('File.read', green_read), ('iter_chunks', green_iter_chunks)):
+            rate, delay = run(path, mb * len(chunk), nreaders, read)
+            print('{:12s} {:8.0f} MB/s  max ticker delay {:7.2f} ms'.format(name, rate, delay))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Count how many times a task watching a directory is woken up while many files in
+# it are rewritten in a burst (like a git checkout would do), with and without
+# debouncing.
+#
+# Usage: python benchmarks/fs_watch.py [files] [debounce]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import watch
+
+
+def run(directory, nfiles, debounce):
+    loop = evergreen.EventLoop()
+    watcher = watch.FSWatcher(directory, debounce=debounce, max_delay=max(debounce, 1.0))
+    stats = {'wakeups': 0, 'changes': 0}
+
+    def consumer():
+        for changes in watcher:
+            stats['wakeups'] += 1
+            stats['changes'] += len(changes)
+
+    def producer():
+        for x in range(nfiles):
+            with open(os.path.join(directory, 'file%d' % x), 'w') as f:
+                f.write('x' * x)
+            if x % 10 == 0:
+                evergreen.sleep(0)
+        evergreen.sleep(debounce + 0.1)
+        watcher.close()
+
+    evergreen.spawn(consumer)
+    evergreen.spawn(producer)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    return stats['wakeups'], stats['changes'], elapsed
+
+
+def main():
+    nfiles = int(sys.argv[1] if len(sys.argv) > 1 else 1000)
+    debounce = float(sys.argv[2] if len(sys.argv) > 2 else 0.1)
+    directory = tempfile.mkdtemp()
+    try:
+        for d in (0, debounce):
+            wakeups, changes, elapsed = run(directory, nfiles, d)
+            print('debounce {:5.2f}s: {:5d} wakeups, {:5d} changed files reported ({:.2f}s)'.format(d, wakeups, changes, elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
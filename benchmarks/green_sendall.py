@@ -0,0 +1,84 @@
+# Measure throughput of the green socket write paths: sendall of a single large
+# buffer, sendall of a list of 16KB buffers (written with sendmsg) versus joining
+# them first, and sendfile versus reading the file and calling sendall.
+#
+# Usage: python benchmarks/green_sendall.py [megabytes]
+
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.lib import socket
+
+
+def run(nbytes, send):
+    loop = evergreen.EventLoop()
+    a, b = socket.socketpair()
+
+    def reader():
+        received = 0
+        while received < nbytes:
+            data = b.recv(256*1024)
+            if not data:
+                break
+            received += len(data)
+
+    def writer():
+        send(a)
+
+    evergreen.spawn(reader)
+    evergreen.spawn(writer)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    a.close()
+    b.close()
+    loop.destroy()
+    return nbytes / elapsed / (1024*1024)
+
+
+def main():
+    mb = int(sys.argv[1] if len(sys.argv) > 1 else 256)
+    chunk = os.urandom(1024*1024)
+    nbytes = mb * len(chunk)
+    pieces = [chunk[i:i+16384] for i in range(0, len(chunk), 16384)]
+    f = tempfile.TemporaryFile()
+    for x in range(mb):
+        f.write(chunk)
+    f.flush()
+
+    def sendall(sock):
+        for x in range(mb):
+            sock.sendall(chunk)
+
+    def sendall_join(sock):
+        for x in range(mb):
+            sock.sendall(b''.join(pieces))
+
+    def sendall_list(sock):
+        for x in range(mb):
+            sock.sendall(pieces)
+
+    def read_sendall(sock):
+        f.seek(0)
+        while True:
+            data = f.read(64*1024)
+            if not data:
+                break
+            sock.sendall(data)
+
+    def sendfile(sock):
+        f.seek(0)
+        sock.sendfile(f)
+
+    for name, func in (('sendall', sendall), ('sendall(join)', sendall_join), ('sendall(list)', sendall_list),
+                       ('read+sendall', read_sendall), ('sendfile', sendfile)):
+        print('{:14s} {:8.0f} MB/s'.format(name, run(nbytes, func)))
+    f.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Measure request/response round-trips per second with the green socket module,
+# as used by monkey-patched libraries.
+#
+# Each client task sends a small request over its own evergreen.lib.socket
+# connection and waits for a 1 byte response, so every round-trip blocks in
+# recv and waits for the socket to become readable.
+#
+# Usage: python benchmarks/green_socket_rpc.py [seconds] [clients]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import tcp
+from evergreen.lib import socket
+
+
+class Server(tcp.TCPServer):
+
+    @evergreen.task
+    def handle_connection(self, connection):
+        while True:
+            data = connection.read_until(b'\n')
+            if not data:
+                break
+            connection.write(b'+')
+
+
+def main():
+    duration = float(sys.argv[1] if len(sys.argv) > 1 else 2)
+    nclients = int(sys.argv[2] if len(sys.argv) > 2 else 1)
+    loop = evergreen.EventLoop()
+    server = Server()
+    server.bind(('127.0.0.1', 0))
+    address = ('127.0.0.1', server.sockname[1])
+    stats = {'count': 0, 'running': nclients}
+
+    def client():
+        sock = socket.create_connection(address)
+        end = time.time() + duration
+        count = 0
+        while time.time() < end:
+            sock.sendall(b'GET key\n')
+            sock.recv(1)
+            count += 1
+        sock.close()
+        stats['count'] += count
+        stats['running'] -= 1
+        if not stats['running']:
+            server.close()
+
+    evergreen.spawn(server.serve)
+    for x in range(nclients):
+        evergreen.spawn(client)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    print('{:.0f} round-trips/s ({} clients)'.format(stats['count'] / elapsed, nclients))
+
+
+if __name__ == '__main__':
+    main()
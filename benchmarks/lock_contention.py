@@ -0,0 +1,52 @@
+# Measure lock throughput and fairness when many tasks contend for a single lock.
+#
+# Each task repeatedly acquires the lock, yields to the loop while holding it and
+# releases it. Reports lock handoffs per second and the spread between the tasks
+# which acquired the lock the most and the least times.
+#
+# Usage: python benchmarks/lock_contention.py [tasks] [seconds]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.locks import Lock
+
+
+def run(ntasks, duration, handoff):
+    loop = evergreen.EventLoop()
+    lock = Lock(handoff=handoff)
+    counts = [0] * ntasks
+    state = {'running': True}
+
+    def worker(index):
+        while state['running']:
+            with lock:
+                counts[index] += 1
+                evergreen.sleep(0)
+
+    def stop():
+        state['running'] = False
+
+    for x in range(ntasks):
+        evergreen.spawn(worker, x)
+    loop.call_later(duration, stop)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    return sum(counts) / elapsed, min(counts), max(counts)
+
+
+def main():
+    ntasks = int(sys.argv[1] if len(sys.argv) > 1 else 100)
+    duration = float(sys.argv[2] if len(sys.argv) > 2 else 2)
+    for handoff in (False, True):
+        rate, lo, hi = run(ntasks, duration, handoff)
+        print('handoff={!s:5} {:10.0f} acquisitions/s  min={} max={} per task'.format(handoff, rate, lo, hi))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Measure how piping data through a child process (gzip) affects the responsiveness
+# of the loop, using subprocess versus evergreen.io.process. A ticker task asks to be
+# woken up every millisecond and the worst delay is reported.
+#
+# Usage: python benchmarks/process_pipe.py [megabytes] [processes]
+
+import os
+import subprocess
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import process
+
+CHUNK_SIZE = 64*1024
+
+
+def run(data, nprocs, compress):
+    loop = evergreen.EventLoop()
+    stats = {'running': nprocs, 'max_delay': 0.0, 'output': 0}
+
+    def ticker():
+        while stats['running']:
+            t0 = time.time()
+            evergreen.sleep(0.001)
+            stats['max_delay'] = max(stats['max_delay'], time.time() - t0 - 0.001)
+
+    def worker():
+        stats['output'] += compress(data)
+        stats['running'] -= 1
+
+    evergreen.spawn(ticker)
+    for x in range(nprocs):
+        evergreen.spawn(worker)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    return len(data) * nprocs / elapsed / (1024*1024), stats['max_delay'] * 1000
+
+
+def blocking_gzip(data):
+    p = subprocess.Popen(['gzip', '-1'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, _ = p.communicate(data)
+    return len(out)
+
+
+def green_gzip(data):
+    p = process.Process(['gzip', '-1'], stdin=process.PIPE, stdout=process.PIPE)
+    chunks = (data[i:i+CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+    out, _ = p.communicate(chunks)
+    return len(out)
+
+
+def green_gzip_streaming(data):
+    p = process.Process(['gzip', '-1'], stdin=process.PIPE, stdout=process.PIPE)
+    size = [0]
+    def on_output(chunk):
+        size[0] += len(chunk)
+    chunks = (data[i:i+CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+    p.communicate(chunks, stdout_callback=on_output)
+    return size[0]
+
+
+def main():
+    mb = int(sys.argv[1] if len(sys.argv) > 1 else 32)
+    nprocs = int(sys.argv[2] if len(sys.argv) > 2 else 4)
+    data = os.urandom(1024*1024) * mb
+    for name, compress in (('subprocess', blocking_gzip), ('Process', green_gzip), ('streaming', green_gzip_streaming)):
+        rate, delay = run(data, nprocs, compress)
+        print('{:12s} {:8.1f} MB/s  max ticker delay {:8.2f} ms'.format(name, rate, delay))
+
+
+if __name__ == '__main__':
+    main()
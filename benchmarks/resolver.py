@@ -0,0 +1,50 @@
+# Measure getaddrinfo lookups per second from many concurrent tasks, sending
+# every lookup to the thread pool versus going through the loop's caching resolver.
+#
+# Usage: python benchmarks/resolver.py [lookups] [tasks] [host]
+
+import os
+import socket
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.lib import socket as green_socket
+
+
+def run(count, ntasks, host, cached):
+    loop = evergreen.EventLoop()
+
+    def lookup():
+        if cached:
+            return green_socket.getaddrinfo(host, 80, 0, socket.SOCK_STREAM)
+        return loop._threadpool.spawn(socket.getaddrinfo, host, 80, 0, socket.SOCK_STREAM).get()
+
+    def worker(n):
+        for x in range(n):
+            lookup()
+
+    for x in range(ntasks):
+        evergreen.spawn(worker, count // ntasks)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    resolver = loop.resolver
+    loop.destroy()
+    return count / elapsed, resolver
+
+
+def main():
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 20000)
+    ntasks = int(sys.argv[2] if len(sys.argv) > 2 else 100)
+    host = sys.argv[3] if len(sys.argv) > 3 else 'localhost'
+    rate, _ = run(count, ntasks, host, False)
+    print('thread pool: {:10.0f} lookups/s'.format(rate))
+    rate, resolver = run(count, ntasks, host, True)
+    print('resolver:    {:10.0f} lookups/s  hits={} misses={} coalesced={}'.format(
+          rate, resolver.hits, resolver.misses, resolver.coalesced))
+
+
+if __name__ == '__main__':
+    main()
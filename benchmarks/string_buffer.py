@@ -0,0 +1,77 @@
+# Measure StringBuffer throughput for typical stream workloads.
+#
+# http:     4KB chunks carrying HTTP-style requests, consumed with read_until
+#           (request line and headers) and read_bytes (body).
+# payload:  4KB chunks consumed with large read_bytes calls.
+# longline: a single long line arriving in 4KB chunks, with a delimited read
+#           attempted after every chunk (like a stream waiting for the delimiter).
+#
+# Usage: python benchmarks/string_buffer.py [megabytes]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from evergreen.io.util import StringBuffer
+
+
+def chunked(data, size=4096):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+def bench_http(megabytes):
+    body = b'b' * 512
+    request = (b'POST /some/resource HTTP/1.1\r\n' +
+               b''.join(b'X-Header-%d: some header value\r\n' % i for i in range(12)) +
+               b'Content-Length: 512\r\n\r\n' + body)
+    data = request * (megabytes * 1024 * 1024 // len(request))
+    chunks = chunked(data)
+    buf = StringBuffer()
+    t0 = time.time()
+    requests = 0
+    for chunk in chunks:
+        buf.feed(chunk)
+        while True:
+            # a real parser would keep its state between chunks, keep it simple
+            if buf.size < len(request):
+                break
+            while buf.read_until(b'\r\n') != b'\r\n':
+                pass
+            buf.read(len(body))
+            requests += 1
+    return len(data), time.time() - t0
+
+
+def bench_payload(megabytes):
+    data = b'p' * (megabytes * 1024 * 1024)
+    chunks = chunked(data)
+    buf = StringBuffer()
+    t0 = time.time()
+    for chunk in chunks:
+        buf.feed(chunk)
+        buf.read(1024 * 1024)
+    return len(data), time.time() - t0
+
+
+def bench_longline(megabytes):
+    line = b'l' * (megabytes * 1024 * 1024 // 8) + b'\r\n'
+    chunks = chunked(line)
+    buf = StringBuffer()
+    t0 = time.time()
+    for x in range(8):
+        for chunk in chunks:
+            buf.feed(chunk)
+            buf.read_until(b'\r\n')
+    return len(line) * 8, time.time() - t0
+
+
+def main():
+    megabytes = int(sys.argv[1] if len(sys.argv) > 1 else 64)
+    for name, func in (('http', bench_http), ('payload', bench_payload), ('longline', bench_longline)):
+        nbytes, elapsed = func(megabytes if name != 'longline' else max(1, megabytes // 16))
+        print('{:10} {:8.1f} MB/s'.format(name, nbytes / elapsed / (1024*1024)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# Measure bulk transfer throughput over a loopback TCP connection.
+#
+# The server streams a payload as fast as it can and the client consumes it with
+# TCPStream.read_bytes, once with the default read mode and once with continuous
+# reading enabled.
+#
+# Usage: python benchmarks/tcp_bulk.py [megabytes] [read size]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import tcp
+
+
+CHUNK = b'x' * (64*1024)
+
+
+class SourceServer(tcp.TCPServer):
+
+    def __init__(self, nchunks):
+        super(SourceServer, self).__init__()
+        self.nchunks = nchunks
+
+    @evergreen.task
+    def handle_connection(self, connection):
+        for x in range(self.nchunks):
+            connection.write(CHUNK)
+            if x % 16 == 0:
+                connection.flush()
+        connection.flush()
+        connection.close()
+
+
+def run(megabytes, read_size, continuous):
+    loop = evergreen.EventLoop()
+    server = SourceServer(megabytes * 16)
+    server.bind(('127.0.0.1', 0))
+    stats = {'received': 0, 'elapsed': 0}
+
+    def client():
+        c = tcp.TCPClient()
+        c.connect(('127.0.0.1', server.sockname[1]))
+        if continuous:
+            c.set_continuous_read(True)
+        t0 = time.time()
+        received = 0
+        while True:
+            data = c.read_bytes(read_size)
+            if not data:
+                break
+            received += len(data)
+        stats['elapsed'] = time.time() - t0
+        stats['received'] = received
+        server.close()
+
+    evergreen.spawn(server.serve)
+    evergreen.spawn(client)
+    loop.run()
+    loop.destroy()
+    return stats['received'] / stats['elapsed'] / (1024*1024)
+
+
+def main():
+    megabytes = int(sys.argv[1] if len(sys.argv) > 1 else 256)
+    read_size = int(sys.argv[2] if len(sys.argv) > 2 else 16*1024)
+    for continuous in (False, True):
+        rate = run(megabytes, read_size, continuous)
+        print('continuous={!s:5} {:8.1f} MB/s'.format(continuous, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Measure how an echo server scales when connections are handled by several loops.
+#
+# A MultiTCPServer with an increasing number of worker processes is started, and
+# load is generated by client processes, each one running a loop with several
+# connections doing request/response round-trips.
+#
+# Usage: python benchmarks/tcp_multicore.py [max workers] [seconds]
+
+import multiprocessing
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import tcp
+
+
+ADDRESS = ('127.0.0.1', 12345)
+CLIENT_PROCESSES = 4
+CONNECTIONS = 16
+MESSAGE = b'x' * 63 + b'\n'
+
+
+class EchoServer(tcp.MultiTCPServer):
+
+    @evergreen.task
+    def handle_connection(self, connection):
+        while True:
+            data = connection.read_until(b'\n')
+            if not data:
+                break
+            connection.write(data)
+
+
+def client_process(start, duration, queue):
+    loop = evergreen.EventLoop()
+    counts = []
+
+    def client():
+        c = tcp.TCPClient()
+        c.connect(ADDRESS)
+        count = 0
+        end = start + duration
+        while time.time() < end:
+            c.write(MESSAGE)
+            c.read_until(b'\n')
+            count += 1
+        c.close()
+        counts.append(count)
+
+    time.sleep(max(0, start - time.time()))
+    for x in range(CONNECTIONS):
+        evergreen.spawn(client)
+    loop.run()
+    queue.put(sum(counts))
+
+
+def run(workers, duration):
+    queue = multiprocessing.Queue()
+    start = time.time() + 1
+    # clients are forked before this process uses its loop
+    clients = [multiprocessing.Process(target=client_process, args=(start, duration, queue)) for x in range(CLIENT_PROCESSES)]
+    for p in clients:
+        p.start()
+    loop = evergreen.EventLoop()
+    server = EchoServer(workers=workers, processes=True, reuse_port=hasattr(tcp.__socket__, 'SO_REUSEPORT'))
+    server.bind(ADDRESS)
+    loop.call_later(duration + 2, server.close)
+    evergreen.spawn(server.serve)
+    loop.run()
+    loop.destroy()
+    total = sum(queue.get() for p in clients)
+    for p in clients:
+        p.join()
+    return total / duration
+
+
+def main():
+    max_workers = int(sys.argv[1] if len(sys.argv) > 1 else multiprocessing.cpu_count())
+    duration = float(sys.argv[2] if len(sys.argv) > 2 else 3)
+    workers = 1
+    while workers <= max_workers:
+        print('workers={:<3} {:10.0f} round-trips/s'.format(workers, run(workers, duration)))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Measure short RPC calls over loopback TCP, connecting for every call versus
+# checking connections out of a TCPConnectionPool.
+#
+# Several tasks issue calls concurrently, each call writes a line and waits for
+# the echo. Reports calls per second and the pool statistics.
+#
+# Usage: python benchmarks/tcp_pool.py [seconds] [tasks]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import tcp
+
+
+class EchoServer(tcp.TCPServer):
+
+    @evergreen.task
+    def handle_connection(self, connection):
+        while True:
+            data = connection.read_until(b'\n')
+            if not data:
+                break
+            connection.write(data)
+
+
+def run(duration, ntasks, pooled):
+    loop = evergreen.EventLoop()
+    server = EchoServer()
+    server.bind(('127.0.0.1', 0))
+    address = ('127.0.0.1', server.sockname[1])
+    pool = tcp.TCPConnectionPool(max_size=ntasks)
+    stats = {'count': 0, 'running': ntasks}
+
+    def call():
+        if pooled:
+            with pool.connection(address) as c:
+                c.write(b'PING\n')
+                c.read_until(b'\n')
+        else:
+            c = tcp.TCPClient()
+            c.connect(address)
+            c.write(b'PING\n')
+            c.read_until(b'\n')
+            c.close()
+
+    def worker(end):
+        while time.time() < end:
+            call()
+            stats['count'] += 1
+        stats['running'] -= 1
+        if not stats['running']:
+            pool.close()
+            server.close()
+
+    evergreen.spawn(server.serve)
+    end = time.time() + duration
+    for x in range(ntasks):
+        evergreen.spawn(worker, end)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    return stats['count'] / elapsed, pool.stats
+
+
+def main():
+    duration = float(sys.argv[1] if len(sys.argv) > 1 else 2)
+    ntasks = int(sys.argv[2] if len(sys.argv) > 2 else 10)
+    rate, _ = run(duration, ntasks, False)
+    print('connect per call: {:8.0f} calls/s'.format(rate))
+    rate, stats = run(duration, ntasks, True)
+    print('pooled:           {:8.0f} calls/s  hit rate {:.3f}'.format(rate, stats['hit_rate']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Measure request/response round-trips per second over a loopback TCP connection.
+#
+# The client writes a fixed size message and waits for the echo with
+# TCPStream.read_bytes, so every round-trip goes through a stream read.
+#
+# Usage: python benchmarks/tcp_read.py [seconds] [size]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import tcp
+
+
+class EchoServer(tcp.TCPServer):
+
+    def __init__(self, size):
+        super(EchoServer, self).__init__()
+        self.size = size
+
+    @evergreen.task
+    def handle_connection(self, connection):
+        while True:
+            data = connection.read_bytes(self.size)
+            if not data:
+                break
+            connection.write(data)
+
+
+def main():
+    duration = float(sys.argv[1] if len(sys.argv) > 1 else 2)
+    size = int(sys.argv[2] if len(sys.argv) > 2 else 64)
+    loop = evergreen.EventLoop()
+    server = EchoServer(size)
+    server.bind(('127.0.0.1', 0))
+    msg = b'x' * size
+    stats = {'count': 0}
+
+    def client():
+        c = tcp.TCPClient()
+        c.connect(('127.0.0.1', server.sockname[1]))
+        end = time.time() + duration
+        count = 0
+        while time.time() < end:
+            c.write(msg)
+            c.read_bytes(size)
+            count += 1
+        stats['count'] = count
+        c.close()
+        server.close()
+
+    evergreen.spawn(server.serve)
+    evergreen.spawn(client)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0
+    loop.destroy()
+    print('{:.0f} round-trips/s ({} byte messages)'.format(stats['count'] / elapsed, size))
+
+
+if __name__ == '__main__':
+    main()
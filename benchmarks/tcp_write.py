@@ -0,0 +1,82 @@
+# Measure the cost of sending small messages made of several parts over a loopback
+# TCP connection.
+#
+# Every message is sent as a header, a body and a trailer, either with three
+# write calls, with a single writelines call or with three write calls on a
+# stream with write coalescing enabled.
+#
+# Usage: python benchmarks/tcp_write.py [messages]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import tcp
+
+
+HEADER = b'HEADER 0123456789\r\n'
+BODY = b'b' * 100
+TRAILER = b'\r\nEND\r\n'
+MESSAGE_SIZE = len(HEADER) + len(BODY) + len(TRAILER)
+
+
+class SinkServer(tcp.TCPServer):
+
+    def __init__(self, nbytes):
+        super(SinkServer, self).__init__()
+        self.nbytes = nbytes
+
+    @evergreen.task
+    def handle_connection(self, connection):
+        connection.set_continuous_read(True)
+        remaining = self.nbytes
+        while remaining:
+            data = connection.read_bytes(min(remaining, 65536))
+            if not data:
+                break
+            remaining -= len(data)
+        self.close()
+
+
+def run(count, mode):
+    loop = evergreen.EventLoop()
+    server = SinkServer(count * MESSAGE_SIZE)
+    server.bind(('127.0.0.1', 0))
+    stats = {'elapsed': 0}
+
+    def client():
+        c = tcp.TCPClient()
+        c.connect(('127.0.0.1', server.sockname[1]))
+        if mode == 'coalesce':
+            c.set_write_coalescing(True)
+        t0 = time.time()
+        for x in range(count):
+            if mode == 'writelines':
+                c.writelines((HEADER, BODY, TRAILER))
+            else:
+                c.write(HEADER)
+                c.write(BODY)
+                c.write(TRAILER)
+            if x % 100 == 0:
+                # let the loop run, like a server handling many requests would
+                evergreen.sleep(0)
+        c.flush()
+        stats['elapsed'] = time.time() - t0
+
+    evergreen.spawn(server.serve)
+    evergreen.spawn(client)
+    loop.run()
+    loop.destroy()
+    return count / stats['elapsed']
+
+
+def main():
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 100000)
+    for mode in ('write', 'writelines', 'coalesce'):
+        print('{:10} {:10.0f} messages/s'.format(mode, run(count, mode)))
+
+
+if __name__ == '__main__':
+    main()
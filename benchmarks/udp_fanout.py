@@ -0,0 +1,75 @@
+# Measure fan-out of messages to many receivers on the local host, sending a
+# unicast datagram to every receiver versus a single multicast datagram to a
+# group all of them joined.
+#
+# Usage: python benchmarks/udp_fanout.py [messages] [receivers]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import udp
+
+GROUP = '239.255.0.1'
+
+
+def run(count, nreceivers, multicast):
+    loop = evergreen.EventLoop()
+    receivers = []
+    port = 0
+    for x in range(nreceivers):
+        endpoint = udp.UDPEndpoint()
+        endpoint.bind(('0.0.0.0', port))
+        if multicast:
+            endpoint.join_group(GROUP, '127.0.0.1')
+            port = endpoint.sockname[1]
+        endpoint.set_continuous_receive(True, queue_size=count)
+        receivers.append(endpoint)
+    client = udp.UDPEndpoint()
+    client.bind(('127.0.0.1', 0))
+    client.set_multicast_loop(True)
+    stats = {'received': 0}
+
+    def receiver(endpoint):
+        while True:
+            data = endpoint.receive_many(1024, timeout=0.2)
+            if not data:
+                break
+            stats['received'] += len(data)
+        endpoint.close()
+
+    def sender():
+        datagram = b'x' * 64
+        if multicast:
+            targets = [(datagram, (GROUP, port))]
+        else:
+            targets = [(datagram, endpoint.sockname) for endpoint in receivers]
+        for x in range(count):
+            client.send_many(targets)
+            client.flush()
+            # don't overflow the receivers' socket buffers
+            evergreen.sleep(0)
+        client.close()
+
+    for endpoint in receivers:
+        evergreen.spawn(receiver, endpoint)
+    evergreen.spawn(sender)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0 - 0.2
+    loop.destroy()
+    return count / elapsed, stats['received']
+
+
+def main():
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 10000)
+    nreceivers = int(sys.argv[2] if len(sys.argv) > 2 else 50)
+    for name, multicast in (('unicast', False), ('multicast', True)):
+        rate, received = run(count, nreceivers, multicast)
+        print('{:10s} {:8.0f} messages/s  delivered={}/{}'.format(name, rate, received, count * nreceivers))
+
+
+if __name__ == '__main__':
+    main()
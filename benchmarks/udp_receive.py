@@ -0,0 +1,74 @@
+# Measure UDP datagrams per second received over loopback, receiving one datagram
+# at a time versus continuous receiving with receive_many, and sending with send
+# versus send_many.
+#
+# Usage: python benchmarks/udp_receive.py [datagrams] [batch]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import evergreen
+from evergreen.io import udp
+from evergreen.timeout import Timeout
+
+
+def run(count, batch, batched):
+    loop = evergreen.EventLoop()
+    server = udp.UDPEndpoint()
+    server.bind(('127.0.0.1', 0))
+    address = server.sockname
+    client = udp.UDPEndpoint()
+    stats = {'received': 0, 'done': False}
+    if batched:
+        server.set_continuous_receive(True, queue_size=4096)
+
+    def receiver():
+        while not stats['done']:
+            if batched:
+                stats['received'] += len(server.receive_many(batch, timeout=0.1))
+            else:
+                try:
+                    with Timeout(0.1):
+                        server.receive()
+                except Timeout:
+                    continue
+                stats['received'] += 1
+        server.close()
+
+    def sender():
+        datagram = b'x' * 64
+        for x in range(count // batch):
+            if batched:
+                client.send_many([(datagram, address)] * batch)
+            else:
+                for y in range(batch):
+                    client.send(datagram, address)
+            client.flush()
+            # let the receiver keep up, the kernel drops what doesn't fit
+            evergreen.sleep(0)
+        client.close()
+        evergreen.sleep(0.2)
+        stats['done'] = True
+
+    evergreen.spawn(receiver)
+    evergreen.spawn(sender)
+    t0 = time.time()
+    loop.run()
+    elapsed = time.time() - t0 - 0.2
+    dropped = server.dropped
+    loop.destroy()
+    return stats['received'] / elapsed, stats['received'], dropped
+
+
+def main():
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 200000)
+    batch = int(sys.argv[2] if len(sys.argv) > 2 else 64)
+    for name, batched in (('send/receive', False), ('send_many/receive_many', True)):
+        rate, received, dropped = run(count, batch, batched)
+        print('{:24s} {:10.0f} datagrams/s  received={} dropped={}'.format(name, rate, received, dropped))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
+import heapq
+import itertools
 import os
 import pyuv
 import sys
@@ -20,8 +22,8 @@ except ImportError:
 
 from collections import deque
 from fibers import Fiber
-from functools import partial
 
+from evergreen.core.resolver import Resolver
 from evergreen.core.socketpair import SocketPair
 from evergreen.core.threadpool import ThreadPool
 
@@ -31,40 +33,47 @@ __all__ = ['EventLoop']
 _tls = threading.local()
 
 
-class Handler(partial):
+class Handler(object):
+    __slots__ = ('_callback', '_args', '_kwargs', '_cancelled')
 
-    def __new__(cls, func, *args, **kw):
-        assert not isinstance(func, Handler)
-        obj = partial.__new__(cls, func, *args, **kw)
-        obj._cancelled = False
-        return obj
+    def __init__(self, callback, args, kwargs):
+        assert not isinstance(callback, Handler)
+        self._callback = callback
+        self._args = args
+        self._kwargs = kwargs or None
+        self._cancelled = False
+
+    def __call__(self):
+        if self._kwargs:
+            self._callback(*self._args, **self._kwargs)
+        else:
+            self._callback(*self._args)
 
     def cancel(self):
         self._cancelled = True
 
 
 class Timer(Handler):
+    __slots__ = ('_loop',)
 
-    def __new__(cls, handle, func, *args, **kw):
-        obj = Handler.__new__(cls, func, *args, **kw)
-        obj._timer_h = handle
-        return obj
+    def __init__(self, loop, callback, args, kwargs):
+        super(Timer, self).__init__(callback, args, kwargs)
+        self._loop = loop
 
     def cancel(self):
         super(Timer, self).cancel()
-        if self._timer_h and not self._timer_h.closed:
-            loop = self._timer_h.loop.event_loop
-            self._timer_h.close()
-            loop._timers.remove(self._timer_h)
-        self._timer_h = None
+        if self._loop is not None:
+            # Still scheduled, the heap entry is removed lazily
+            self._loop._timer_cancelled()
+            self._loop = None
 
 
 class SignalHandler(Handler):
+    __slots__ = ('_signal_h',)
 
-    def __new__(cls, handle, func, *args, **kw):
-        obj = Handler.__new__(cls, func, *args, **kw)
-        obj._signal_h = handle
-        return obj
+    def __init__(self, handle, callback, args, kwargs):
+        super(SignalHandler, self).__init__(callback, args, kwargs)
+        self._signal_h = handle
 
     def cancel(self):
         super(SignalHandler, self).cancel()
@@ -75,9 +84,34 @@ class SignalHandler(Handler):
         self._signal_h = None
 
 
+class ReadyStats(object):
+    """Counters describing how the ready queue was processed. The *last_* attributes refer
+    to the most recent loop iteration, the rest are totals since the loop was created.
+    """
+
+    __slots__ = ('iterations', 'processed', 'skipped', 'deferred',
+                 'last_processed', 'last_skipped', 'last_deferred')
+
+    def __init__(self):
+        self.iterations = 0
+        self.processed = self.last_processed = 0
+        self.skipped = self.last_skipped = 0
+        self.deferred = self.last_deferred = 0
+
+    def __repr__(self):
+        return '<%s iterations=%d processed=%d skipped=%d deferred=%d>' % (
+            self.__class__.__name__, self.iterations, self.processed, self.skipped, self.deferred)
+
+
 RUN_DEFAULT = 1
 RUN_FOREVER = 2
 
+# libuv timers have millisecond granularity, timers due within this margin are fired together
+_TIMER_GRANULARITY = 0.001
+
+# Minimum size of the timers heap for cancelled entries to be purged before they expire
+_MIN_TIMERS_COMPACT = 100
+
 class EventLoop(object):
 
     def __init__(self):
@@ -88,6 +122,7 @@ class EventLoop(object):
         self._loop.excepthook = self._handle_error
         self._loop.event_loop = self
         self._threadpool = ThreadPool(self)
+        self._resolver = Resolver(self)
         self.task = Fiber(self._run_loop)
 
         self._destroyed = False
@@ -96,10 +131,17 @@ class EventLoop(object):
 
         self._fd_map = dict()
         self._signals = dict()
-        self._timers = set()
+        self._timers = []
+        self._timers_seq = itertools.count()
+        self._timers_active = 0
+        self._timers_deadline = None
         self._ready = deque()
+        self._ready_max_count = None
+        self._ready_max_time = None
+        self._ready_stats = ReadyStats()
 
         self._ready_processor = pyuv.Idle(self._loop)
+        self._timer_h = pyuv.Timer(self._loop)
         self._waker = pyuv.Async(self._loop, self._async_cb)
         self._waker.unref()
 
@@ -122,13 +164,34 @@ class EventLoop(object):
     def running(self):
         return self._running
 
+    @property
+    def ready_stats(self):
+        return self._ready_stats
+
+    @property
+    def resolver(self):
+        return self._resolver
+
+    def set_ready_budget(self, max_count=None, max_time=None):
+        """Limit the amount of work done with queued callbacks in a single loop iteration.
+        At most *max_count* callbacks are run and no new callback is started after *max_time*
+        seconds have elapsed. Callbacks over the budget are run in the next iteration, after
+        the loop has polled for i/o. Passing None disables the respective limit.
+        """
+        if max_count is not None and max_count <= 0:
+            raise ValueError('max_count must be a positive number')
+        if max_time is not None and max_time <= 0:
+            raise ValueError('max_time must be a positive number')
+        self._ready_max_count = max_count
+        self._ready_max_time = max_time
+
     def call_soon(self, callback, *args, **kw):
-        handler = Handler(callback, *args, **kw)
+        handler = Handler(callback, args, kw)
         self._add_callback(handler)
         return handler
 
     def call_from_thread(self, callback, *args, **kw):
-        handler = Handler(callback, *args, **kw)
+        handler = Handler(callback, args, kw)
         # Here we don't call self._add_callback on purpose, because it's not thread
         # safe to start pyuv handles. We just append the callback to the queue and
         # wakeup the loop. This is thread safe because the queue is only processed
@@ -140,11 +203,12 @@ class EventLoop(object):
     def call_later(self, delay, callback, *args, **kw):
         if delay <= 0:
             return self.call_soon(callback, *args, **kw)
-        timer_h = pyuv.Timer(self._loop)
-        handler = Timer(timer_h, callback, *args, **kw)
-        timer_h.handler = handler
-        timer_h.start(self._timer_cb, delay, 0)
-        self._timers.add(timer_h)
+        when = self.time() + delay
+        handler = Timer(self, callback, args, kw)
+        heapq.heappush(self._timers, (when, next(self._timers_seq), handler))
+        self._timers_active += 1
+        if self._timers_deadline is None or when < self._timers_deadline:
+            self._arm_timer(when)
         return handler
 
     def call_at(self, when, callback, *args, **kw):
@@ -154,7 +218,7 @@ class EventLoop(object):
         return _time()
 
     def add_reader(self, fd, callback, *args, **kw):
-        handler = Handler(callback, *args, **kw)
+        handler = Handler(callback, args, kw)
         try:
             poll_h = self._fd_map[fd]
         except KeyError:
@@ -177,8 +241,11 @@ class EventLoop(object):
             poll_h.pevents &= ~pyuv.UV_READABLE
             poll_h.read_handler = None
             if poll_h.pevents == 0:
-                poll_h.close()
-                del self._fd_map[fd]
+                if poll_h.refs:
+                    poll_h.stop()
+                else:
+                    poll_h.close()
+                    del self._fd_map[fd]
             else:
                 poll_h.start(poll_h.pevents, self._poll_cb)
             if handler:
@@ -187,7 +254,7 @@ class EventLoop(object):
             return False
 
     def add_writer(self, fd, callback, *args, **kw):
-        handler = Handler(callback, *args, **kw)
+        handler = Handler(callback, args, kw)
         try:
             poll_h = self._fd_map[fd]
         except KeyError:
@@ -210,8 +277,11 @@ class EventLoop(object):
             poll_h.pevents &= ~pyuv.UV_WRITABLE
             poll_h.write_handler = None
             if poll_h.pevents == 0:
-                poll_h.close()
-                del self._fd_map[fd]
+                if poll_h.refs:
+                    poll_h.stop()
+                else:
+                    poll_h.close()
+                    del self._fd_map[fd]
             else:
                 poll_h.start(poll_h.pevents, self._poll_cb)
             if handler:
@@ -222,7 +292,7 @@ class EventLoop(object):
     def add_signal_handler(self, sig, callback, *args, **kwargs):
         self._validate_signal(sig)
         signal_h = pyuv.Signal(self._loop)
-        handler = SignalHandler(signal_h, callback, *args, **kwargs)
+        handler = SignalHandler(signal_h, callback, args, kwargs)
         signal_h.handler = handler
         signal_h.signum = sig
         try:
@@ -303,21 +373,28 @@ class EventLoop(object):
         self._loop.excepthook = None
         self._loop = None
         self._threadpool = None
+        self._resolver = None
 
         self._ready_processor = None
+        self._timer_h = None
         self._waker = None
 
         self._fd_map.clear()
         self._signals.clear()
-        self._timers.clear()
+        for _, _, handler in self._timers:
+            handler._loop = None
+        del self._timers[:]
         self._ready.clear()
 
     # internal
 
     def _add_callback(self, cb):
-        self._ready.append(cb)
-        if not self._ready_processor.active:
+        # The ready processor is only stopped once the queue has been drained, so it only needs
+        # to be started when the queue is empty. Callbacks added by call_from_thread start it
+        # from the async handle callback.
+        if not self._ready:
             self._ready_processor.start(self._process_ready)
+        self._ready.append(cb)
 
     def _handle_error(self, typ, value, tb):
         if not issubclass(typ, SystemExit):
@@ -344,30 +421,108 @@ class EventLoop(object):
         poll_h.pevents = 0
         poll_h.read_handler = None
         poll_h.write_handler = None
+        poll_h.refs = 0
         return poll_h
 
+    def _ref_fd(self, fd):
+        # Keep the poll handle for fd open while no reader or writer is registered, for
+        # objects which wait on the same fd over and over again
+        try:
+            poll_h = self._fd_map[fd]
+        except KeyError:
+            poll_h = self._create_poll_handle(fd)
+            self._fd_map[fd] = poll_h
+        poll_h.refs += 1
+
+    def _unref_fd(self, fd):
+        try:
+            poll_h = self._fd_map[fd]
+        except KeyError:
+            return
+        poll_h.refs -= 1
+        if poll_h.refs == 0 and poll_h.pevents == 0:
+            poll_h.close()
+            del self._fd_map[fd]
+
     def _process_ready(self, handle):
-        # Run all queued callbacks
-        ntodo = len(self._ready)
-        for x in range(ntodo):
-            handler = self._ready.popleft()
-            if not handler._cancelled:
-                # loop.excepthook takes care of exception handling
-                handler()
-        if not self._ready:
+        # Run the callbacks which were queued before this iteration started, within the
+        # configured budget. Cancelled handlers are dropped without counting against it.
+        ready = self._ready
+        popleft = ready.popleft
+        ntodo = len(ready)
+        max_count = self._ready_max_count or ntodo
+        if self._ready_max_time is not None:
+            deadline = _time() + self._ready_max_time
+        else:
+            deadline = None
+        processed = skipped = 0
+        try:
+            while ntodo and processed < max_count:
+                ntodo -= 1
+                handler = popleft()
+                if handler._cancelled:
+                    skipped += 1
+                    continue
+                processed += 1
+                # loop.excepthook takes care of exception handling. The handler is
+                # not called directly to save a frame on this hot path.
+                if handler._kwargs:
+                    handler._callback(*handler._args, **handler._kwargs)
+                else:
+                    handler._callback(*handler._args)
+                # the clock is only read when there is a time budget
+                if deadline is not None and _time() >= deadline:
+                    break
+        finally:
+            stats = self._ready_stats
+            stats.iterations += 1
+            stats.processed += processed
+            stats.skipped += skipped
+            stats.deferred += ntodo
+            stats.last_processed = processed
+            stats.last_skipped = skipped
+            stats.last_deferred = ntodo
+        if not ready:
             self._ready_processor.stop()
 
     def _async_cb(self, handle):
         if not self._ready_processor.active:
             self._ready_processor.start(self._process_ready)
 
-    def _timer_cb(self, timer):
-        assert not timer.handler._cancelled
-        assert not timer.repeat
-        self._add_callback(timer.handler)
-        timer.close()
-        self._timers.remove(timer)
-        del timer.handler
+    def _arm_timer(self, when):
+        self._timers_deadline = when
+        self._timer_h.start(self._timer_cb, max(when - self.time(), 0), 0)
+
+    def _timer_cb(self, timer_h):
+        self._timers_deadline = None
+        timers = self._timers
+        end = self.time() + _TIMER_GRANULARITY
+        while timers:
+            when, _, handler = timers[0]
+            if handler._cancelled:
+                heapq.heappop(timers)
+                continue
+            if when > end:
+                break
+            heapq.heappop(timers)
+            handler._loop = None
+            self._timers_active -= 1
+            self._add_callback(handler)
+        if timers:
+            self._arm_timer(timers[0][0])
+
+    def _timer_cancelled(self):
+        self._timers_active -= 1
+        timers = self._timers
+        if not self._timers_active:
+            # Only cancelled timers are left, don't keep the loop alive because of them
+            del timers[:]
+            self._timer_h.stop()
+            self._timers_deadline = None
+        elif len(timers) > _MIN_TIMERS_COMPACT and self._timers_active < len(timers) // 2:
+            # Most entries are cancelled, purge them
+            timers[:] = [item for item in timers if not item[2]._cancelled]
+            heapq.heapify(timers)
 
     def _signal_cb(self, signal_h, signum):
         self._add_callback(signal_h.handler)
@@ -438,6 +593,13 @@ class EventLoop(object):
         if self._signal_checker:
             self._signal_checker.close()
             self._signal_checker = None
+            try:
+                old_wakeup_fd = signal.set_wakeup_fd(-1)
+                if old_wakeup_fd != self._socketpair.writer_fileno():
+                    # Someone else replaced it, leave theirs in place
+                    signal.set_wakeup_fd(old_wakeup_fd)
+            except ValueError:
+                pass
         if self._socketpair:
             self._socketpair.close()
             self._socketpair = None
@@ -0,0 +1,203 @@
+#
+# This file is part of Evergreen. See the NOTICE for more information.
+#
+
+import functools
+import six
+import socket
+
+__all__ = ['Resolver']
+
+"""Caching name resolver. Lookups are run in the loop's thread pool, their results
+(including failures) are kept for a while and concurrent lookups for the same name
+share a single request. Each event loop has its own resolver.
+"""
+
+
+class _Node(object):
+    __slots__ = ('prev', 'next', 'key', 'value', 'error', 'expires')
+
+
+class _LRUCache(object):
+    """Size bounded mapping which drops the least recently used entries first. Entries
+    are kept in a circular doubly linked list, most recently used first.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._map = {}
+        self._root = root = _Node()
+        root.prev = root.next = root
+
+    def __len__(self):
+        return len(self._map)
+
+    def get(self, key, now):
+        node = self._map.get(key)
+        if node is None:
+            return None
+        self._unlink(node)
+        if node.expires <= now:
+            del self._map[key]
+            return None
+        self._link_first(node)
+        return node
+
+    def set(self, key, value, error, expires):
+        node = self._map.get(key)
+        if node is None:
+            node = self._map[key] = _Node()
+            node.key = key
+        else:
+            self._unlink(node)
+        node.value = value
+        node.error = error
+        node.expires = expires
+        self._link_first(node)
+        while len(self._map) > self.max_size:
+            last = self._root.prev
+            self._unlink(last)
+            del self._map[last.key]
+
+    def clear(self):
+        self._map.clear()
+        root = self._root
+        root.prev = root.next = root
+
+    def _link_first(self, node):
+        root = self._root
+        node.prev = root
+        node.next = root.next
+        root.next.prev = node
+        root.next = node
+
+    def _unlink(self, node):
+        node.prev.next = node.next
+        node.next.prev = node.prev
+        node.prev = node.next = None
+
+
+def _is_ip_address(host, families=(socket.AF_INET, socket.AF_INET6)):
+    if not isinstance(host, six.string_types) or not hasattr(socket, 'inet_pton'):
+        return False
+    for family in families:
+        try:
+            socket.inet_pton(family, host)
+        except (socket.error, ValueError):
+            continue
+        return True
+    return False
+
+
+def _interleave_addrinfos(addrinfos):
+    """Reorder getaddrinfo results so address families alternate, starting with the
+    family of the first result (RFC 8305, section 4).
+    """
+    by_family = {}
+    families = []
+    for info in addrinfos:
+        family = info[0]
+        if family not in by_family:
+            by_family[family] = []
+            families.append(family)
+        by_family[family].append(info)
+    result = []
+    queues = [by_family[family] for family in families]
+    for i in range(max(len(q) for q in queues) if queues else 0):
+        for q in queues:
+            if i < len(q):
+                result.append(q[i])
+    return result
+
+
+class Resolver(object):
+    """Name resolver which caches successful lookups for *ttl* seconds and failed ones
+    (socket.gaierror) for *negative_ttl* seconds, keeping at most *max_size* results.
+    """
+
+    def __init__(self, loop, ttl=60.0, negative_ttl=5.0, max_size=1024):
+        self.loop = loop
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = _LRUCache(max_size)
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def max_size(self):
+        return self._cache.max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        self._cache.max_size = value
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if (host is None or _is_ip_address(host)) and (port is None or isinstance(port, six.integer_types)):
+            # Nothing to look up, don't bother the thread pool
+            return socket.getaddrinfo(host, port, family, type, proto, flags | socket.AI_NUMERICHOST)
+        return list(self._lookup(socket.getaddrinfo, (host, port, family, type, proto, flags)))
+
+    def gethostbyname(self, hostname):
+        if _is_ip_address(hostname, (socket.AF_INET,)):
+            return hostname
+        return self._lookup(socket.gethostbyname, (hostname,))
+
+    def gethostbyname_ex(self, hostname):
+        return self._lookup(socket.gethostbyname_ex, (hostname,))
+
+    def prewarm(self, addresses, family=0, type=socket.SOCK_STREAM):
+        """Start looking up the given (host, port) addresses in the background, so later
+        getaddrinfo calls with the same arguments are answered from the cache.
+        """
+        for host, port in addresses:
+            if _is_ip_address(host):
+                continue
+            key = (socket.getaddrinfo, (host, port, family, type, 0, 0))
+            if key not in self._pending and self._cache.get(key, self.loop.time()) is None:
+                self._start(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def _lookup(self, func, args):
+        key = (func, args)
+        node = self._cache.get(key, self.loop.time())
+        if node is not None:
+            self.hits += 1
+            if node.error is not None:
+                # Raise a new exception every time, the traceback would keep growing otherwise
+                raise node.error.__class__(*node.error.args)
+            return node.value
+        fut = self._pending.get(key)
+        if fut is None:
+            self.misses += 1
+            fut = self._start(key)
+        else:
+            self.coalesced += 1
+        return fut.get()
+
+    def _start(self, key):
+        func, args = key
+        fut = self.loop._threadpool.spawn(func, *args)
+        self._pending[key] = fut
+        fut.add_done_callback(functools.partial(self._lookup_done, key))
+        return fut
+
+    def _lookup_done(self, key, fut):
+        del self._pending[key]
+        if self._cache.max_size <= 0:
+            return
+        try:
+            result = fut.get()
+        except socket.gaierror as e:
+            if self.negative_ttl > 0:
+                self._cache.set(key, None, e, self.loop.time() + self.negative_ttl)
+        except Exception:
+            # Other errors are not worth remembering
+            pass
+        else:
+            if self.ttl > 0:
+                self._cache.set(key, result, None, self.loop.time() + self.ttl)
+
@@ -3,7 +3,6 @@
 #
 
 import pyuv
-import sys
 
 from evergreen.event import Event
 from evergreen.futures import Future
@@ -28,8 +27,8 @@ class _Work(object):
     def __call__(self):
         try:
             self.result = self.func(*self.args, **self.kwargs)
-        except BaseException:
-            self.exc = sys.exc_info()
+        except BaseException as e:
+            self.exc = e
         self = None
 
 
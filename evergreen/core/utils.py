@@ -2,7 +2,12 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
-from evergreen.locks import Condition, Lock
+import evergreen
+
+from fibers import Fiber
+
+from evergreen.locks import Lock
+from evergreen.timeout import Timeout
 
 __all__ = ['Result']
 
@@ -25,16 +30,23 @@ class Result(object):
         # this function runs in a different task
         ...
         result.set_value(42)
+
+    The waiting task is recorded and switched to directly when the result is set from
+    a loop callback (such as a pyuv completion callback), so getting a result does not
+    go through the ready queue. If the waiter is interrupted (by a timeout or by being
+    killed) the pending wakeup is cancelled and a value which arrives after the Result
+    was released is discarded.
     """
 
-    __slots__ = ['_lock', '_cond', '_locked', '_used', '_exc', '_value']
+    __slots__ = ['_lock', '_locked', '_used', '_exc', '_value', '_waiter', '_handler']
 
     def __init__(self):
         self._lock = Lock()
-        self._cond = Condition(Lock())
         self._locked = False
         self._used = False
         self._exc = self._value = Null
+        self._waiter = None
+        self._handler = None
 
     def acquire(self):
         self._lock.acquire()
@@ -46,40 +58,78 @@ class Result(object):
         self._used = False
         self._exc = self._value = Null
 
-    def get(self):
+    def get(self, timeout=None):
         assert self._locked
         assert not self._used
         try:
-            with self._cond:
-                if self._exc == self._value == Null:
-                    self._cond.wait()
-            if self._exc != Null:
+            if self._exc is Null and self._value is Null:
+                self._wait(timeout)
+            if self._exc is not Null:
                 raise self._exc
-            assert self._value != Null
+            assert self._value is not Null
             return self._value
         finally:
             self._used = True
             self._exc = self._value = Null
 
     def set_value(self, value):
-        assert self._locked
+        if not self._locked:
+            # nobody is waiting for this result anymore
+            return
         assert not self._used
-        assert self._exc == self._value == Null
-        with self._cond:
-            self._value = value
-            self._cond.notify_all()
+        assert self._exc is Null and self._value is Null
+        self._value = value
+        self._wakeup()
 
     def set_exception(self, value):
-        assert self._locked
+        if not self._locked:
+            # nobody is waiting for this result anymore
+            return
         assert not self._used
-        assert self._exc == self._value == Null
-        with self._cond:
-            self._exc = value
-            self._cond.notify_all()
+        assert self._exc is Null and self._value is Null
+        self._exc = value
+        self._wakeup()
+
+    def _wait(self, timeout):
+        loop = evergreen.current.loop
+        self._waiter = Fiber.current()
+        if timeout is None:
+            try:
+                loop.switch()
+            finally:
+                self._cleanup()
+            return
+        timer = Timeout(timeout)
+        timer.start()
+        try:
+            loop.switch()
+        except Timeout as e:
+            if e is not timer or (self._exc is Null and self._value is Null):
+                raise
+            # the result arrived just before the timeout fired, use it
+        finally:
+            timer.cancel()
+            self._cleanup()
+
+    def _cleanup(self):
+        self._waiter = None
+        if self._handler is not None:
+            self._handler.cancel()
+            self._handler = None
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is None:
+            return
+        loop = evergreen.current.loop
+        if Fiber.current() is loop.task:
+            self._waiter = None
+            waiter.switch()
+        elif self._handler is None:
+            self._handler = loop.call_soon(waiter.switch)
 
     def __enter__(self):
         self.acquire()
 
     def __exit__(self, typ, val, tb):
         self.release()
-
@@ -2,7 +2,7 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
-from evergreen.locks import Condition, Lock
+from evergreen.locks import WaitQueue
 
 __all__ = ['Event']
 
@@ -10,34 +10,23 @@ __all__ = ['Event']
 class Event(object):
 
     def __init__(self):
-        self._cond = Condition(Lock())
+        # all waiters are woken up at once, a notification must not be passed on to
+        # a task which started waiting after the event was cleared
+        self._waiters = WaitQueue(pass_on=False)
         self._flag = False
 
     def is_set(self):
         return self._flag
 
     def set(self):
-        self._cond.acquire()
-        try:
-            self._flag = True
-            self._cond.notify_all()
-        finally:
-            self._cond.release()
+        self._flag = True
+        self._waiters.notify_all()
 
     def clear(self):
-        self._cond.acquire()
-        try:
-            self._flag = False
-        finally:
-            self._cond.release()
+        self._flag = False
 
     def wait(self, timeout=None):
-        self._cond.acquire()
-        try:
-            signaled = self._flag
-            if not signaled:
-                signaled = self._cond.wait(timeout)
-            return signaled
-        finally:
-            self._cond.release()
+        if self._flag:
+            return True
+        return self._waiters.wait(timeout)
 
@@ -4,13 +4,17 @@
 
 from evergreen.io import errno
 from evergreen.io.pipe import *
+from evergreen.io.process import *
 from evergreen.io.tcp import *
 from evergreen.io.tty import *
 from evergreen.io.udp import *
+from evergreen.io.watch import *
 
 __all__ = [pipe.__all__ +
+           process.__all__ +
            tcp.__all__ +
            tty.__all__ +
            udp.__all__ +
+           watch.__all__ +
            ['errno']]
 
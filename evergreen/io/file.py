@@ -0,0 +1,328 @@
+#
+# This file is part of Evergreen. See the NOTICE for more information.
+#
+
+import errno as _errno
+import functools
+import os
+import pyuv
+import weakref
+
+import evergreen
+from evergreen.futures import Future
+from evergreen.io import errno
+from evergreen.locks import Semaphore
+
+__all__ = ['File', 'FSError', 'open', 'close', 'read', 'write', 'pread', 'pwrite',
+           'stat', 'fstat', 'fsync', 'sendfile', 'set_max_concurrency']
+
+"""Cooperative file I/O. Operations run in the libuv thread pool (using pyuv.fs), so
+reading or writing a file only blocks the task which does it.
+"""
+
+
+FSError = pyuv.error.FSError
+
+DEFAULT_BUFFER_SIZE = 64*1024
+
+# The libuv thread pool (4 threads by default) is shared with name resolution and
+# ThreadPool work, so by default only half of it is used for file operations
+MAX_CONCURRENCY = 2
+
+_limits = weakref.WeakKeyDictionary()
+
+
+def set_max_concurrency(value):
+    """Set the maximum number of file operations which can be running at the same time
+    for the current loop. Other operations wait until one of them finishes.
+    """
+    if value < 1:
+        raise ValueError('value must be greater than 0')
+    _limits[evergreen.current.loop] = Semaphore(value)
+
+
+def _fs_cb(fut, limit, loop, *args):
+    # Callbacks get (path, result, error) or (path, error) depending on the operation
+    limit.release()
+    error = args[-1]
+    if error is not None:
+        fut.set_exception(FSError(error, errno.strerror(error)))
+    else:
+        fut.set_result(args[1] if len(args) == 3 else None)
+
+
+def _get_limit(loop):
+    limit = _limits.get(loop)
+    if limit is None:
+        limit = _limits[loop] = Semaphore(MAX_CONCURRENCY)
+    return limit
+
+
+def _submit(func, *args):
+    loop = evergreen.current.loop
+    limit = _get_limit(loop)
+    limit.acquire()
+    fut = Future()
+    fut.set_running_or_notify_cancel()
+    try:
+        # The slot is given back when the operation finishes, even if nobody waits for it
+        func(loop._loop, *(args + (functools.partial(_fs_cb, fut, limit),)))
+    except BaseException:
+        limit.release()
+        raise
+    return fut
+
+
+def _fs_call(func, *args):
+    return _submit(func, *args).get()
+
+
+def open(path, flags=os.O_RDONLY, mode=0o666):
+    return _fs_call(pyuv.fs.open, path, flags, mode)
+
+
+def close(fd):
+    # pyuv.fs.close corrupts memory when it's given a callback (pyuv 0.10), so run
+    # os.close in the thread pool instead
+    loop = evergreen.current.loop
+    with _get_limit(loop):
+        try:
+            loop._threadpool.spawn(os.close, fd).get()
+        except OSError as e:
+            code = getattr(errno, _errno.errorcode.get(e.errno, ''), None)
+            if code is None:
+                raise FSError(e.errno, e.strerror)
+            raise FSError(code, errno.strerror(code))
+
+
+def read(fd, size):
+    return _fs_call(pyuv.fs.read, fd, size, -1)
+
+
+def pread(fd, size, offset):
+    return _fs_call(pyuv.fs.read, fd, size, offset)
+
+
+def write(fd, data):
+    return _fs_call(pyuv.fs.write, fd, data, -1)
+
+
+def pwrite(fd, data, offset):
+    return _fs_call(pyuv.fs.write, fd, data, offset)
+
+
+def stat(path):
+    return _fs_call(pyuv.fs.stat, path)
+
+
+def fstat(fd):
+    return _fs_call(pyuv.fs.fstat, fd)
+
+
+def fsync(fd):
+    _fs_call(pyuv.fs.fsync, fd)
+
+
+def sendfile(out_fd, in_fd, offset, count):
+    return _fs_call(pyuv.fs.sendfile, out_fd, in_fd, offset, count)
+
+
+def _parse_mode(mode):
+    chars = set(mode)
+    if 't' in chars:
+        raise ValueError('text mode is not supported')
+    if len(chars) != len(mode) or not chars <= set('rwaxb+') or len(chars & set('rwax')) != 1:
+        raise ValueError('invalid mode: %r' % mode)
+    plus = '+' in chars
+    if 'r' in chars:
+        flags = os.O_RDWR if plus else os.O_RDONLY
+    else:
+        flags = (os.O_RDWR if plus else os.O_WRONLY) | os.O_CREAT
+        if 'w' in chars:
+            flags |= os.O_TRUNC
+        elif 'a' in chars:
+            flags |= os.O_APPEND
+        else:
+            flags |= os.O_EXCL
+    readable = 'r' in chars or plus
+    writable = 'r' not in chars or plus
+    return flags, readable, writable
+
+
+class File(object):
+    """Buffered binary file. Reads and writes are done at the file's own position (with
+    pread / pwrite), so tasks can't disturb each other through a shared file offset.
+    """
+
+    def __init__(self, path, mode='r', buffer_size=DEFAULT_BUFFER_SIZE, perm=0o666):
+        if buffer_size <= 0:
+            raise ValueError('buffer_size must be greater than 0')
+        flags, self._readable, self._writable = _parse_mode(mode)
+        self._fd = open(path, flags, perm)
+        self.name = path
+        self.mode = mode
+        self._append = bool(flags & os.O_APPEND)
+        self._buffer_size = buffer_size
+        self._closed = False
+        self._pos = fstat(self._fd).st_size if self._append else 0
+        # Data read ahead, it starts at file offset _rbuf_offset
+        self._rbuf = b''
+        self._rbuf_offset = 0
+        # Data waiting to be written, it starts at file offset _wbuf_offset
+        self._wbuf = []
+        self._wbuf_size = 0
+        self._wbuf_offset = 0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def fileno(self):
+        self._check_closed()
+        return self._fd
+
+    def read(self, size=-1):
+        self._check_closed()
+        if not self._readable:
+            raise IOError('file not open for reading')
+        self._flush_writes()
+        if size is None or size < 0:
+            size = max(fstat(self._fd).st_size - self._pos, 0)
+            data = [self._read(size)] if size else []
+            # the file may have grown in the meantime
+            chunk = self._read(self._buffer_size)
+            while chunk:
+                data.append(chunk)
+                chunk = self._read(self._buffer_size)
+            return b''.join(data)
+        data = []
+        while size > 0:
+            chunk = self._read(size)
+            if not chunk:
+                break
+            data.append(chunk)
+            size -= len(chunk)
+        return b''.join(data)
+
+    def iter_chunks(self, chunk_size=None):
+        """Iterate over the contents of the file, from the current position until EOF.
+        The next chunk is read while the current one is being consumed.
+        """
+        self._check_closed()
+        if not self._readable:
+            raise IOError('file not open for reading')
+        self._flush_writes()
+        if chunk_size is None:
+            chunk_size = self._buffer_size
+        self._rbuf = b''
+        offset = self._pos
+        fut = _submit(pyuv.fs.read, self._fd, chunk_size, offset)
+        while True:
+            data = fut.get()
+            if not data:
+                break
+            offset += len(data)
+            fut = _submit(pyuv.fs.read, self._fd, chunk_size, offset)
+            self._pos = offset
+            yield data
+
+    def write(self, data):
+        self._check_closed()
+        if not self._writable:
+            raise IOError('file not open for writing')
+        if not isinstance(data, bytes):
+            data = memoryview(data).tobytes()
+        self._rbuf = b''
+        if not self._wbuf:
+            self._wbuf_offset = self._pos
+        self._wbuf.append(data)
+        self._wbuf_size += len(data)
+        self._pos += len(data)
+        if self._wbuf_size >= self._buffer_size:
+            self._flush_writes()
+        return len(data)
+
+    def flush(self):
+        self._check_closed()
+        self._flush_writes()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._check_closed()
+        self._flush_writes()
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = fstat(self._fd).st_size + offset
+        else:
+            raise ValueError('invalid whence (%r)' % whence)
+        if pos < 0:
+            raise ValueError('negative seek position %d' % pos)
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        self._check_closed()
+        return self._pos
+
+    def stat(self):
+        self._check_closed()
+        self._flush_writes()
+        return fstat(self._fd)
+
+    def fsync(self):
+        self._check_closed()
+        self._flush_writes()
+        fsync(self._fd)
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self._flush_writes()
+        finally:
+            self._closed = True
+            self._rbuf = b''
+            close(self._fd)
+
+    def _read(self, size):
+        start = self._pos - self._rbuf_offset
+        if 0 <= start < len(self._rbuf):
+            data = self._rbuf[start:start+size]
+        elif size >= self._buffer_size:
+            # large reads skip the buffer
+            data = pread(self._fd, size, self._pos)
+        else:
+            self._rbuf = pread(self._fd, self._buffer_size, self._pos)
+            self._rbuf_offset = self._pos
+            data = self._rbuf[:size]
+        self._pos += len(data)
+        return data
+
+    def _flush_writes(self):
+        if not self._wbuf:
+            return
+        data = b''.join(self._wbuf)
+        offset = self._wbuf_offset
+        self._wbuf = []
+        self._wbuf_size = 0
+        written = 0
+        while written < len(data):
+            if self._append:
+                written += write(self._fd, data[written:])
+            else:
+                written += pwrite(self._fd, data[written:], offset + written)
+        if self._append:
+            self._pos = fstat(self._fd).st_size
+
+    def _check_closed(self):
+        if self._closed:
+            raise ValueError('I/O operation on closed file')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, tb):
+        self.close()
+
@@ -8,7 +8,6 @@ import evergreen
 from evergreen.core.utils import Result
 from evergreen.io import errno
 from evergreen.io.stream import BaseStream, StreamConnection, StreamServer
-from evergreen.log import log
 
 __all__ = ['PipeServer', 'PipeClient', 'PipeConnection', 'PipeStream', 'PipeError']
 
@@ -59,7 +58,7 @@ class PipeClient(BasePipeStream):
                 raise
             try:
                 self._connect_result.get()
-            except PipeError:
+            except BaseException:
                 self.close()
                 raise
         self._set_connected()
@@ -75,8 +74,8 @@ class PipeServer(StreamServer):
     connection_cls = PipeConnection
     error_cls = PipeError
 
-    def __init__(self):
-        super(PipeServer, self).__init__()
+    def __init__(self, max_connections=None):
+        super(PipeServer, self).__init__(max_connections)
         loop = evergreen.current.loop
         self._handle = pyuv.Pipe(loop._loop)
         self._name = None
@@ -91,23 +90,17 @@ class PipeServer(StreamServer):
         self._name = name
 
     def _serve(self, backlog):
-        self._handle.listen(self.__listen_cb, backlog)
+        self._handle.listen(self._listen_cb, backlog)
 
     def _close(self):
         self._handle.close()
 
-    def __listen_cb(self, handle, error):
-        if error is not None:
-            log.debug('listen failed: %d %s', error, errno.strerror(error))
-            return
+    def _accept(self):
         pipe_handle = pyuv.Pipe(self._handle.loop)
         try:
             self._handle.accept(pipe_handle)
-        except PipeError as e:
-            log.debug('accept failed: %d %s', e.args[0], e.args[1])
+        except PipeError:
             pipe_handle.close()
-        else:
-            conn = self.connection_cls(pipe_handle)
-            conn._set_accepted(self)
-            self.handle_connection(conn)
+            raise
+        return pipe_handle
 
@@ -0,0 +1,194 @@
+#
+# This file is part of Evergreen. See the NOTICE for more information.
+#
+
+import os
+import pyuv
+import signal
+import six
+import sys
+
+import evergreen
+from evergreen.event import Event
+from evergreen.io import errno
+from evergreen.io.pipe import PipeStream, PipeError
+
+__all__ = ['Process', 'ProcessError', 'PIPE', 'DEVNULL']
+
+
+ProcessError = pyuv.error.ProcessError
+
+# Same values as in the subprocess module
+PIPE = -1
+DEVNULL = -3
+
+READ_CHUNK_SIZE = 64*1024
+
+
+def _find_executable(name, env, cwd):
+    # libuv reports a failed exec through the exit callback, with an exit code which
+    # can't be told apart from the process' own, so look for the program beforehand
+    if os.path.dirname(name):
+        paths = [cwd or '']
+    else:
+        paths = (env if env is not None else os.environ).get('PATH', os.defpath).split(os.pathsep)
+    for path in paths:
+        filename = os.path.join(path, name)
+        if os.path.isfile(filename) and os.access(filename, os.X_OK):
+            return filename
+    raise ProcessError(errno.ENOENT, errno.strerror(errno.ENOENT))
+
+
+def _read_stream(stream, callback, results, name):
+    # Read until EOF, passing every chunk to the callback or collecting all of them
+    chunks = []
+    buf = bytearray(READ_CHUNK_SIZE)
+    view = memoryview(buf)
+    try:
+        while True:
+            n = stream.read_into(buf)
+            if not n:
+                break
+            if callback is None:
+                chunks.append(view[:n].tobytes())
+            else:
+                callback(view[:n].tobytes())
+    except BaseException:
+        results[name] = (None, sys.exc_info()[1])
+    else:
+        results[name] = (b''.join(chunks) if callback is None else None, None)
+    finally:
+        stream.close()
+
+
+class Process(object):
+    """Child process, started right away. stdin, stdout and stderr can be inherited from
+    the current process (None), connected to pipes (PIPE), redirected to /dev/null
+    (DEVNULL) or redirected to a file descriptor or an object with a fileno() method.
+    """
+
+    def __init__(self, args, executable=None, stdin=None, stdout=None, stderr=None, cwd=None, env=None):
+        if isinstance(args, six.string_types):
+            args = [args]
+        else:
+            args = list(args)
+        self.args = args
+        self.returncode = None
+        self.stdin = self.stdout = self.stderr = None
+        self._exit_event = Event()
+        loop = evergreen.current.loop
+        executable = _find_executable(executable or args[0], env, cwd)
+        stdio = []
+        try:
+            for fd, value, readable in ((0, stdin, True), (1, stdout, False), (2, stderr, False)):
+                stdio.append(self._create_stdio(fd, value, readable))
+            kwargs = {}
+            if env is not None:
+                kwargs['env'] = env
+            if cwd is not None:
+                kwargs['cwd'] = cwd
+            self._handle = pyuv.Process(loop._loop)
+            self._handle.spawn(file=executable, args=args[1:], exit_callback=self.__exit_cb,
+                               stdio=stdio, **kwargs)
+        except BaseException:
+            for stream in (self.stdin, self.stdout, self.stderr):
+                if stream is not None:
+                    stream.close()
+            raise
+        for stream in (self.stdin, self.stdout, self.stderr):
+            if stream is not None:
+                stream._set_connected()
+
+    @property
+    def pid(self):
+        if self.returncode is not None:
+            return None
+        return self._handle.pid
+
+    def wait(self, timeout=None):
+        """Wait for the process to exit and return its exit code, which is negative if
+        the process was terminated by a signal. Returns None if the timeout expires first.
+        """
+        self._exit_event.wait(timeout)
+        return self.returncode
+
+    def poll(self):
+        return self.returncode
+
+    def send_signal(self, signum):
+        if self.returncode is None:
+            self._handle.kill(signum)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def communicate(self, input=None, stdout_callback=None, stderr_callback=None):
+        """Send *input* (data or an iterable of data chunks) to stdin, read stdout and
+        stderr until EOF and wait for the process to exit. Returns a (stdout, stderr)
+        tuple with the collected output, or None for the streams which are not pipes or
+        which have a callback: in that case the callback gets every chunk as it's read,
+        so the output is never held in memory at once.
+        """
+        results = {}
+        readers = []
+        for name, stream, callback in (('stdout', self.stdout, stdout_callback), ('stderr', self.stderr, stderr_callback)):
+            if stream is not None and not stream.closed:
+                readers.append(evergreen.spawn(_read_stream, stream, callback, results, name))
+        if self.stdin is not None and not self.stdin.closed:
+            try:
+                if input is not None:
+                    if isinstance(input, (six.binary_type, bytearray, memoryview)):
+                        input = (input,)
+                    for chunk in input:
+                        self.stdin.write(chunk)
+                        # don't get ahead of the process
+                        self.stdin.drain()
+                self.stdin.shutdown()
+            except PipeError:
+                # the process stopped reading, it will be reflected in the exit code
+                pass
+            finally:
+                self.stdin.close()
+        for task in readers:
+            task.join()
+        self.wait()
+        output = []
+        for name in ('stdout', 'stderr'):
+            value, exc = results.get(name, (None, None))
+            if exc is not None:
+                raise exc
+            output.append(value)
+        return tuple(output)
+
+    def _create_stdio(self, fd, value, readable):
+        if value is None:
+            return pyuv.StdIO(fd=fd, flags=pyuv.UV_INHERIT_FD)
+        elif value == PIPE:
+            stream = PipeStream()
+            setattr(self, ('stdin', 'stdout', 'stderr')[fd], stream)
+            # readable and writable are from the process' point of view
+            flags = pyuv.UV_CREATE_PIPE | (pyuv.UV_READABLE_PIPE if readable else pyuv.UV_WRITABLE_PIPE)
+            return pyuv.StdIO(stream=stream._handle, flags=flags)
+        elif value == DEVNULL:
+            return pyuv.StdIO(flags=pyuv.UV_IGNORE)
+        if not isinstance(value, six.integer_types):
+            value = value.fileno()
+        return pyuv.StdIO(fd=value, flags=pyuv.UV_INHERIT_FD)
+
+    def __exit_cb(self, handle, exit_status, term_signal):
+        self.returncode = -term_signal if term_signal else exit_status
+        self._handle.close()
+        self._exit_event.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, tb):
+        for stream in (self.stdin, self.stdout, self.stderr):
+            if stream is not None:
+                stream.close()
+        self.wait()
+
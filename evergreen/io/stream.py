@@ -7,6 +7,7 @@ import pyuv
 import re
 import six
 import socket
+import struct
 
 import evergreen
 from evergreen.core.utils import Result
@@ -20,6 +21,22 @@ __all__ = ['AbstractBaseStream', 'BaseStream', 'StreamConnection', 'StreamServer
 
 StreamError = pyuv.error.StreamError
 
+# struct codes which can be used for the length field of a frame header
+_FRAME_HEADER_CODES = frozenset('bBhHiIlLqQ')
+
+
+def _parse_frame_header(header):
+    # Returns the struct.Struct object and the largest length the header can hold
+    header = struct.Struct(header)
+    code = header.format
+    if not isinstance(code, str):
+        code = code.decode('ascii')
+    code = code.lstrip('@=<>!')
+    if code not in _FRAME_HEADER_CODES:
+        raise ValueError('frame header must contain a single integer field')
+    bits = 8 * header.size - (1 if code.islower() else 0)
+    return header, (1 << bits) - 1
+
 
 class AbstractBaseStream(six.with_metaclass(abc.ABCMeta)):
     """Abstract base class for a stream-like object
@@ -29,10 +46,14 @@ class AbstractBaseStream(six.with_metaclass(abc.ABCMeta)):
 
     MAX_BUFFER_SIZE = 100*1024*1024
     READ_CHUNK_SIZE = 4*1024
+    FRAME_HEADER = '!I'
+    MAX_FRAME_SIZE = 16*1024*1024
 
     def __init__(self):
         self._read_buffer = StringBuffer(self.MAX_BUFFER_SIZE)
         self._write_buffer = []
+        self._frame_header, self._max_frame_length = _parse_frame_header(self.FRAME_HEADER)
+        self._max_frame_size = self.MAX_FRAME_SIZE
 
         self._connected = False
         self._closed = False
@@ -42,11 +63,51 @@ class AbstractBaseStream(six.with_metaclass(abc.ABCMeta)):
         assert nbytes > 0
         return self._do_read(nbytes=nbytes)
 
-    def read_until(self, delimiter):
-        return self._do_read(delimiter=delimiter)
-
-    def read_until_regex(self, regex):
-        return self._do_read(regex=re.compile(regex))
+    def read_into(self, buf):
+        view = memoryview(buf)
+        assert len(view) > 0
+        return self._do_read(nbytes=1, into=view)
+
+    def read_exactly_into(self, buf):
+        view = memoryview(buf)
+        assert len(view) > 0
+        return self._do_read(nbytes=len(view), into=view)
+
+    def read_until(self, delimiter, max_bytes=None):
+        return self._do_read(delimiter=delimiter, max_bytes=max_bytes)
+
+    def read_until_regex(self, regex, max_bytes=None):
+        return self._do_read(regex=re.compile(regex), max_bytes=max_bytes)
+
+    def read_frame(self):
+        return self._do_read(frame=True)
+
+    def read_frames(self, max_n):
+        assert max_n > 0
+        frame = self._do_read(frame=True)
+        if frame is None:
+            return []
+        frames = [frame]
+        # get any other frames which are already buffered, without waiting
+        while len(frames) < max_n:
+            frame = self._read_from_buffer(frame=True)
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    def write_frame(self, data):
+        if len(data) > self._max_frame_size:
+            raise ValueError('frame too large: %d bytes' % len(data))
+        if len(data) > self._max_frame_length:
+            raise ValueError('frame too large for the header: %d bytes' % len(data))
+        return self.writelines([self._frame_header.pack(len(data)), data])
+
+    def set_frame_format(self, header=None, max_size=None):
+        if header is not None:
+            self._frame_header, self._max_frame_length = _parse_frame_header(header)
+        if max_size is not None:
+            self._max_frame_size = max_size
 
     def write(self, data):
         self._check_closed()
@@ -56,6 +117,17 @@ class AbstractBaseStream(six.with_metaclass(abc.ABCMeta)):
         else:
             return self._write(data)
 
+    def writelines(self, seq):
+        self._check_closed()
+        seq = list(seq)
+        if not self._connected:
+            self._write_buffer.extend(seq)
+            return False
+        elif not seq:
+            return True
+        else:
+            return self._writelines(seq)
+
     def shutdown(self):
         self._check_closed()
         self._shutdown()
@@ -76,30 +148,47 @@ class AbstractBaseStream(six.with_metaclass(abc.ABCMeta)):
         self._connected = True
         buf, self._write_buffer = self._write_buffer, []
         if buf:
-            self._write(b''.join(buf))
+            self._writelines(buf)
 
     # internal
 
-    def _do_read(self, delimiter=None, nbytes=None, regex=None):
+    def _do_read(self, delimiter=None, nbytes=None, regex=None, max_bytes=None, into=None, frame=False):
         # See if we've already got the data from a previous read
-        data = self._read_from_buffer(delimiter, nbytes, regex)
+        data = self._read_from_buffer(delimiter, nbytes, regex, max_bytes, into, frame)
         if data is not None:
             return data
         self._check_closed()
         while not self.closed:
             self._read(self.READ_CHUNK_SIZE)
-            data = self._read_from_buffer(delimiter, nbytes, regex)
+            data = self._read_from_buffer(delimiter, nbytes, regex, max_bytes, into, frame)
             if data is not None:
                 return data
-        return b''
+        if frame:
+            return None
+        return b'' if into is None else 0
 
-    def _read_from_buffer(self, delimiter=None, nbytes=None, regex=None):
+    def _read_from_buffer(self, delimiter=None, nbytes=None, regex=None, max_bytes=None, into=None, frame=False):
+        if frame:
+            try:
+                return self._read_buffer.read_frame(self._frame_header, self._max_frame_size)
+            except IOError as e:
+                self.close()
+                raise self.error_cls(str(e))
         if nbytes is not None:
-            return self._read_buffer.read(nbytes)
-        elif delimiter is not None:
-            return self._read_buffer.read_until(delimiter)
-        elif regex is not None:
-            return self._read_buffer.read_until_regex(regex)
+            if into is None:
+                return self._read_buffer.read(nbytes)
+            elif self._read_buffer.size >= nbytes:
+                # copy straight from the read buffer into the given one
+                return self._read_buffer.read_into(into)
+            return None
+        try:
+            if delimiter is not None:
+                return self._read_buffer.read_until(delimiter, max_bytes)
+            elif regex is not None:
+                return self._read_buffer.read_until_regex(regex, max_bytes)
+        except IOError as e:
+            self.close()
+            raise self.error_cls(str(e))
 
     def _check_closed(self):
         if self._closed:
@@ -115,6 +204,9 @@ class AbstractBaseStream(six.with_metaclass(abc.ABCMeta)):
     def _write(self, data):
         raise NotImplementedError
 
+    def _writelines(self, seq):
+        return self._write(b''.join(seq))
+
     @abc.abstractmethod
     def _shutdown(self):
         raise NotImplementedError
@@ -128,6 +220,9 @@ class BaseStream(AbstractBaseStream):
     """Base class for streams implemented using pyuv Stream objects as the underlying mechanism
     """
 
+    READ_HIGH_WATER = 256*1024
+    WRITE_HIGH_WATER = 64*1024
+
     def __init__(self):
         super(BaseStream, self).__init__()
         self._read_result = Result()
@@ -135,12 +230,78 @@ class BaseStream(AbstractBaseStream):
         self._pending_writes = 0
         self._flush_event = Event()
         self._flush_event.set()
+        self._continuous_read = False
+        self._read_high_water = self.READ_HIGH_WATER
+        self._reading = False
+        self._read_waiting = False
+        self._read_exc = None
+        self._coalesce_writes = False
+        self._coalesced = []
+        self._coalesced_size = 0
+        self._coalesce_handler = None
+        self._write_high_water = self.WRITE_HIGH_WATER
+        self._write_low_water = self.WRITE_HIGH_WATER // 4
+        self._drain_event = Event()
+        self._drain_event.set()
+
+    @property
+    def write_buffer_size(self):
+        return self._handle.write_queue_size + self._coalesced_size
 
     def flush(self):
         self._check_closed()
+        self._flush_coalesced()
         self._flush_event.wait()
 
+    def drain(self):
+        self._check_closed()
+        if self.write_buffer_size > self._write_high_water:
+            self._flush_coalesced()
+            if self._handle.write_queue_size > self._write_low_water:
+                self._drain_event.clear()
+                self._drain_event.wait()
+                self._check_closed()
+
+    def set_write_watermarks(self, high=None, low=None):
+        if high is None:
+            high = self.WRITE_HIGH_WATER if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError('high (%r) must be >= low (%r) must be >= 0' % (high, low))
+        self._write_high_water = high
+        self._write_low_water = low
+
+    def set_write_coalescing(self, enabled):
+        self._check_closed()
+        self._coalesce_writes = bool(enabled)
+        if not self._coalesce_writes:
+            self._flush_coalesced()
+
+    def set_continuous_read(self, enabled, high_water=None):
+        self._check_closed()
+        if high_water is not None:
+            if high_water <= 0:
+                raise ValueError('high_water must be greater than 0')
+            self._read_high_water = high_water
+        self._continuous_read = bool(enabled)
+        if self._continuous_read:
+            if self._connected:
+                self._maybe_resume_reading()
+        elif self._reading:
+            self._reading = False
+            self._handle.stop_read()
+
+    def _read_from_buffer(self, delimiter=None, nbytes=None, regex=None, max_bytes=None, into=None, frame=False):
+        data = super(BaseStream, self)._read_from_buffer(delimiter, nbytes, regex, max_bytes, into, frame)
+        if data is not None and self._continuous_read:
+            self._maybe_resume_reading()
+        return data
+
     def _read(self, n):
+        if self._continuous_read:
+            self._read_continuous()
+            return
         with self._read_result:
             try:
                 self._handle.start_read(self.__read_cb)
@@ -153,12 +314,62 @@ class BaseStream(AbstractBaseStream):
                 self.close()
                 if e.args[0] != errno.EOF:
                     raise
+            except BaseException:
+                # interrupted while waiting, no longer interested in the data
+                if not self._handle.closed:
+                    self._handle.stop_read()
+                raise
             else:
                 self._read_buffer.feed(data)
 
+    def _read_continuous(self):
+        if self._read_exc is not None:
+            exc, self._read_exc = self._read_exc, None
+            if not isinstance(exc, self.error_cls):
+                raise exc
+            self.close()
+            if exc.args[0] != errno.EOF:
+                raise exc
+            return
+        with self._read_result:
+            if not self._reading:
+                # paused due to backpressure, but the caller needs more data
+                self._start_reading()
+            self._read_waiting = True
+            try:
+                self._read_result.get()
+            finally:
+                self._read_waiting = False
+
+    def _start_reading(self):
+        try:
+            self._handle.start_read(self.__continuous_read_cb)
+        except self.error_cls:
+            self.close()
+            raise
+        self._reading = True
+
+    def _maybe_resume_reading(self):
+        if self._reading or self._closed or self._read_exc is not None:
+            return
+        if self._read_buffer.size < self._read_high_water // 2:
+            self._start_reading()
+
     def _write(self, data):
+        if self._coalesce_writes:
+            self._coalesce((data,))
+            return False
+        return self._submit_write(self._handle.write, data)
+
+    def _writelines(self, seq):
+        if self._coalesce_writes:
+            self._coalesce(seq)
+            return False
+        return self._submit_write(self._handle.writelines, seq)
+
+    def _submit_write(self, func, data):
         try:
-            self._handle.write(data, self.__write_cb)
+            func(data, self.__write_cb)
         except self.error_cls:
             self.close()
             raise
@@ -167,13 +378,48 @@ class BaseStream(AbstractBaseStream):
         self._pending_writes += 1
         return self._handle.write_queue_size == 0
 
+    def _coalesce(self, seq):
+        # Writes issued during this loop iteration are sent together with a single
+        # vectored write once the ready callbacks run
+        self._coalesced.extend(seq)
+        self._coalesced_size += sum(len(data) for data in seq)
+        if self._coalesce_handler is None:
+            self._coalesce_handler = evergreen.current.loop.call_soon(self.__coalesce_cb)
+
+    def _flush_coalesced(self):
+        if self._coalesce_handler is not None:
+            self._coalesce_handler.cancel()
+            self._coalesce_handler = None
+        buf, self._coalesced = self._coalesced, []
+        self._coalesced_size = 0
+        if buf:
+            self._submit_write(self._handle.writelines, buf)
+
     def _shutdown(self):
+        self._flush_coalesced()
         with self._shutdown_result:
             self._handle.shutdown(self.__shutdown_cb)
             self._shutdown_result.get()
 
     def _close(self):
+        self._reading = False
+        if self._coalesce_handler is not None:
+            self._coalesce_handler.cancel()
+            self._coalesce_handler = None
+        buf, self._coalesced = self._coalesced, []
+        self._coalesced_size = 0
+        if buf and not self._handle.closed:
+            # libuv tries to write the data right away, but closing the handle cancels
+            # whatever the kernel didn't take at once, so that part is discarded. Use
+            # flush() before close() to make sure everything is sent.
+            try:
+                self._handle.writelines(buf, self.__write_cb)
+            except self.error_cls:
+                pass
+            else:
+                self._pending_writes += 1
         self._handle.close()
+        self._drain_event.set()
 
     def __read_cb(self, handle, data, error):
         self._handle.stop_read()
@@ -182,10 +428,34 @@ class BaseStream(AbstractBaseStream):
         else:
             self._read_result.set_value(data)
 
+    def __continuous_read_cb(self, handle, data, error):
+        if error is not None:
+            self._read_exc = self.error_cls(error, pyuv.errno.strerror(error))
+        else:
+            try:
+                self._read_buffer.feed(data)
+            except IOError as e:
+                self._read_exc = e
+        if self._read_exc is not None or self._read_buffer.size >= self._read_high_water:
+            self._reading = False
+            self._handle.stop_read()
+        if self._read_waiting:
+            self._read_waiting = False
+            self._read_result.set_value(None)
+
+    def __coalesce_cb(self):
+        self._coalesce_handler = None
+        try:
+            self._flush_coalesced()
+        except self.error_cls as e:
+            log.debug('write failed: %s', e)
+
     def __write_cb(self, handle, error):
         self._pending_writes -= 1
         if self._pending_writes == 0:
             self._flush_event.set()
+        if not self._drain_event.is_set() and self._handle.write_queue_size <= self._write_low_water:
+            self._drain_event.set()
         if error is not None:
             log.debug('write failed: %d %s', error, pyuv.errno.strerror(error))
             evergreen.current.loop.call_soon(self.close)
@@ -206,23 +476,28 @@ class StreamConnection(BaseStream):
     def close(self):
         super(StreamConnection, self).close()
         if self._server:
-            self._server.connections.remove(self)
+            self._server._remove_connection(self)
             self._server = None
 
     def _set_accepted(self, server):
         # To be called by the server
         self._server = server
-        self._server.connections.append(self)
+        self._server._add_connection(self)
         self._set_connected()
 
 
 class StreamServer(object):
     error_cls = None  # to be defined by subclass
+    connection_cls = None  # to be defined by subclass
 
-    def __init__(self):
+    def __init__(self, max_connections=None):
+        if max_connections is not None and max_connections < 1:
+            raise ValueError('max_connections must be greater than 0')
         self._end_event = Event()
         self._closed = False
-        self.connections = []
+        self._accept_paused = False
+        self.max_connections = max_connections
+        self.connections = set()
 
     def handle_connection(self, connection):
         raise NotImplementedError
@@ -241,7 +516,7 @@ class StreamServer(object):
         if not self._closed:
             self._close()
             self._closed = True
-            for conn in self.connections[:]:
+            for conn in list(self.connections):
                 conn.close()
             self._end_event.set()
 
@@ -249,12 +524,58 @@ class StreamServer(object):
         if self._closed:
             raise self.error_cls('server is closed')
 
+    def _add_connection(self, connection):
+        self.connections.add(connection)
+
+    def _remove_connection(self, connection):
+        self.connections.discard(connection)
+        if self._accept_paused and not self._closed and not self._at_limit():
+            self._accept_paused = False
+            evergreen.current.loop.call_soon(self._resume_accept)
+
+    def _at_limit(self):
+        return self.max_connections is not None and len(self.connections) >= self.max_connections
+
+    def _listen_cb(self, handle, error):
+        # libuv accepts connections in a loop until EAGAIN and calls this once for each of
+        # them. If the pending connection is not accepted here libuv stops watching the
+        # listening socket until it is, so this is how accepting is paused.
+        if error is not None:
+            log.debug('listen failed: %d %s', error, errno.strerror(error))
+            return
+        if self._at_limit():
+            self._accept_paused = True
+            return
+        self._accept_connection()
+
+    def _resume_accept(self):
+        if self._closed:
+            return
+        if self._at_limit():
+            self._accept_paused = True
+            return
+        self._accept_connection()
+
+    def _accept_connection(self):
+        try:
+            handle = self._accept()
+        except self.error_cls as e:
+            log.debug('accept failed: %d %s', e.args[0], e.args[1])
+        else:
+            conn = self.connection_cls(handle)
+            conn._set_accepted(self)
+            self.handle_connection(conn)
+
     def _bind(self, address):
         raise NotImplementedError
 
     def _serve(self, backlog):
         raise NotImplementedError
 
+    def _accept(self):
+        # Accept the pending connection and return its handle
+        raise NotImplementedError
+
     def _close(self):
         raise NotImplementedError
 
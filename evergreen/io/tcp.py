@@ -2,16 +2,26 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
+import contextlib
+import copy
+import mmap
+import multiprocessing
+import os
 import pyuv
+import socket as __socket__
+import struct
+import threading
 
 import evergreen
+from evergreen.core.resolver import _interleave_addrinfos
 from evergreen.core.utils import Result
 from evergreen.io import errno
+from evergreen.io.pipe import PipeStream
 from evergreen.io.stream import BaseStream, StreamConnection, StreamServer
 from evergreen.lib import socket
-from evergreen.log import log
+from evergreen.locks import WaitQueue
 
-__all__ = ['TCPServer', 'TCPClient', 'TCPConnection', 'TCPError']
+__all__ = ['TCPServer', 'MultiTCPServer', 'TCPClient', 'TCPConnection', 'TCPConnectionPool', 'TCPError']
 
 
 TCPError = pyuv.error.TCPError
@@ -49,7 +59,7 @@ class TCPClient(TCPStream):
         super(TCPClient, self).__init__(handle)
         self._connect_result = Result()
 
-    def connect(self, target, source_address=None):
+    def connect(self, target, source_address=None, happy_eyeballs_delay=None):
         if self._connected:
             raise TCPError('already connected')
         host, port = target
@@ -60,15 +70,29 @@ class TCPClient(TCPStream):
         if not r:
             raise TCPError('getaddrinfo returned no result')
 
+        if happy_eyeballs_delay is None:
+            addrs = [self.__strip_scope(item[-1]) for item in r]
+            handle = self.__connect_sequential(addrs, source_address)
+        else:
+            addrs = [self.__strip_scope(item[-1]) for item in _interleave_addrinfos(r)]
+            handle = self.__connect_staggered(addrs, source_address, happy_eyeballs_delay)
+        self._handle.close()
+        self._handle = handle
+        self._set_connected()
+
+    @staticmethod
+    def __strip_scope(addr):
+        idx = addr[0].find('%')
+        if idx != -1:
+            host, rest = addr[0], addr[1:]
+            addr = (host[:idx],) + rest
+        return addr
+
+    def __connect_sequential(self, addrs, source_address):
         err = None
         loop = self._handle.loop
-        for item in r:
+        for addr in addrs:
             with self._connect_result:
-                addr = item[-1]
-                idx = addr[0].find('%')
-                if idx != -1:
-                    host, rest = addr[0], addr[1:]
-                    addr = (host[:idx],) + rest
                 handle = pyuv.TCP(loop)
                 try:
                     if source_address:
@@ -84,13 +108,67 @@ class TCPClient(TCPStream):
                     err = e
                     handle.close()
                     continue
+                except BaseException:
+                    handle.close()
+                    raise
                 else:
-                    self._handle.close()
-                    self._handle = handle
-                    break
-        if err is not None:
-            raise err
-        self._set_connected()
+                    return handle
+        raise err
+
+    def __connect_staggered(self, addrs, source_address, delay):
+        # Happy Eyeballs (RFC 8305): a new attempt is started every *delay* seconds, or as
+        # soon as the previous one fails, without cancelling the ones in progress. The
+        # first attempt to succeed wins and the rest are closed.
+        loop = evergreen.current.loop
+        result = self._connect_result
+        attempts = iter(addrs)
+        pending = set()
+        errors = []
+        state = {'timer': None, 'done': False}
+
+        def start_next():
+            state['timer'] = None
+            for addr in attempts:
+                handle = pyuv.TCP(self._handle.loop)
+                try:
+                    if source_address:
+                        handle.bind(source_address)
+                    handle.connect(addr, connect_cb)
+                except TCPError as e:
+                    errors.append(e)
+                    handle.close()
+                    continue
+                pending.add(handle)
+                state['timer'] = loop.call_later(delay, start_next)
+                return
+            if not pending:
+                result.set_exception(errors[-1])
+
+        def connect_cb(handle, error):
+            pending.discard(handle)
+            if state['done']:
+                if not handle.closed:
+                    handle.close()
+            elif error is None:
+                result.set_value(handle)
+            else:
+                errors.append(TCPError(error, errno.strerror(error)))
+                handle.close()
+                if state['timer'] is not None:
+                    state['timer'].cancel()
+                start_next()
+
+        with result:
+            try:
+                start_next()
+                return result.get()
+            finally:
+                state['done'] = True
+                if state['timer'] is not None:
+                    state['timer'].cancel()
+                for handle in pending:
+                    handle.close()
+                pending.clear()
 
     def __connect_cb(self, handle, error):
         if error is not None:
@@ -107,8 +185,8 @@ class TCPServer(StreamServer):
     connection_cls = TCPConnection
     error_cls = TCPError
 
-    def __init__(self):
-        super(TCPServer, self).__init__()
+    def __init__(self, max_connections=None):
+        super(TCPServer, self).__init__(max_connections)
         loop = evergreen.current.loop
         self._handle = pyuv.TCP(loop._loop)
 
@@ -121,23 +199,374 @@ class TCPServer(StreamServer):
         self._handle.bind(address)
 
     def _serve(self, backlog):
-        self._handle.listen(self.__listen_cb, backlog)
+        self._handle.listen(self._listen_cb, backlog)
 
     def _close(self):
         self._handle.close()
 
-    def __listen_cb(self, handle, error):
-        if error is not None:
-            log.debug('listen failed: %d %s', error, errno.strerror(error))
-            return
+    def _accept(self):
         tcp_handle = pyuv.TCP(self._handle.loop)
         try:
             self._handle.accept(tcp_handle)
-        except TCPError as e:
-            log.debug('accept failed: %d %s', e.args[0], e.args[1])
+        except TCPError:
             tcp_handle.close()
+            raise
+        return tcp_handle
+
+
+class _PoolEntry(object):
+    __slots__ = ('idle', 'size', 'waiters')
+
+    def __init__(self):
+        self.idle = []
+        self.size = 0
+        self.waiters = WaitQueue()
+
+
+class TCPConnectionPool(object):
+    """Pool of connected TCPClient objects, keyed by (host, port). At most *max_size*
+    connections (idle or in use) are kept for each key, idle connections are closed after
+    *idle_timeout* seconds.
+    """
+
+    client_cls = TCPClient
+
+    def __init__(self, max_size=10, idle_timeout=60.0, keepalive=None):
+        if max_size < 1:
+            raise ValueError('max_size must be greater than 0')
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._entries = {}
+        self._in_use = {}
+        self._idle_timers = {}
+        self._closed = False
+        self._hits = 0
+        self._misses = 0
+        self._discarded = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def stats(self):
+        requests = self._hits + self._misses
+        return {'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': float(self._hits) / requests if requests else 0.0,
+                'discarded': self._discarded,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'idle': len(self._idle_timers),
+                'in_use': len(self._in_use)}
+
+    def get(self, address, timeout=None):
+        """Check out a connection to the given address, reusing an idle one if possible.
+        If *max_size* connections to the address are in use, wait (up to *timeout*
+        seconds) until one is returned.
+        """
+        self._check_closed()
+        key = tuple(address)
+        loop = evergreen.current.loop
+        start = None
+        while True:
+            # The entry may be dropped while waiting, so look it up every time
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _PoolEntry()
+            while entry.idle:
+                client = entry.idle.pop()
+                self._idle_timers.pop(client).cancel()
+                if self._is_reusable(client):
+                    client.set_continuous_read(False)
+                    self._hits += 1
+                    self._check_out(client, key, start, loop)
+                    return client
+                self._discarded += 1
+                client.close()
+                entry.size -= 1
+            if entry.size < self.max_size:
+                break
+            # Tasks which were woken up but lost the race for the connection go back
+            # to the front of the queue
+            front = start is not None
+            if start is None:
+                start = loop.time()
+                self._waits += 1
+            if timeout is not None:
+                remaining = start + timeout - loop.time()
+                if remaining <= 0 or not entry.waiters.wait(remaining, front=front):
+                    self._wait_time += loop.time() - start
+                    raise TCPError('timed out waiting for a connection to %s:%s' % key[:2])
+            else:
+                entry.waiters.wait(front=front)
+            self._check_closed()
+        self._misses += 1
+        entry.size += 1
+        client = self.client_cls()
+        try:
+            client.connect(key)
+            if self.keepalive is not None:
+                client._handle.keepalive(True, int(self.keepalive))
+        except BaseException:
+            client.close()
+            self._release_slot(key, entry, None)
+            raise
+        self._check_out(client, key, start, loop)
+        return client
+
+    def put(self, client, reuse=True):
+        """Return a connection to the pool. It's closed instead of kept if *reuse* is
+        False, if it's no longer usable or if the pool is closed.
+        """
+        try:
+            key = self._in_use.pop(client)
+        except KeyError:
+            raise ValueError('connection does not belong to this pool')
+        entry = self._entries[key]
+        if not reuse or self._closed or not self._is_reusable(client):
+            self._discarded += 1
+            self._release_slot(key, entry, client)
+            return
+        client.set_continuous_read(True)
+        entry.idle.append(client)
+        loop = evergreen.current.loop
+        self._idle_timers[client] = loop.call_later(self.idle_timeout, self._expire, key, client)
+        entry.waiters.notify()
+
+    @contextlib.contextmanager
+    def connection(self, address, timeout=None):
+        """Context manager which checks out a connection and returns it to the pool
+        afterwards. The connection is closed if the block raises an exception.
+        """
+        client = self.get(address, timeout)
+        try:
+            yield client
+        except BaseException:
+            self.put(client, reuse=False)
+            raise
+        else:
+            self.put(client)
+
+    def close(self):
+        """Close all idle connections. Connections which are in use are closed when they
+        are returned.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for key, entry in list(self._entries.items()):
+            while entry.idle:
+                client = entry.idle.pop()
+                self._idle_timers.pop(client).cancel()
+                self._release_slot(key, entry, client)
+            entry.waiters.notify_all()
+
+    def _check_closed(self):
+        if self._closed:
+            raise TCPError('connection pool is closed')
+
+    def _check_out(self, client, key, start, loop):
+        if start is not None:
+            self._wait_time += loop.time() - start
+        self._in_use[client] = key
+
+    def _is_reusable(self, client):
+        # Idle connections are kept reading, so EOF, errors or unexpected data sent by
+        # the peer show up here without blocking
+        return not client.closed and client._read_exc is None and client._read_buffer.size == 0
+
+    def _release_slot(self, key, entry, client):
+        if client is not None:
+            client.close()
+        entry.size -= 1
+        if entry.size == 0 and not len(entry.waiters):
+            del self._entries[key]
+        else:
+            entry.waiters.notify()
+
+    def _expire(self, key, client):
+        self._idle_timers.pop(client, None)
+        entry = self._entries[key]
+        entry.idle.remove(client)
+        self._release_slot(key, entry, client)
+
+
+class MultiTCPServer(TCPServer):
+    """TCP server which accepts and handles connections on several event loops. Besides
+    the loop where serve() is called, *workers* - 1 extra loops are run, either in threads
+    or in forked processes. Subclasses implement handle_connection, which is called in
+    the worker loop which accepted the connection.
+    """
+
+    def __init__(self, workers=None, processes=False, reuse_port=False, max_connections=None):
+        super(MultiTCPServer, self).__init__(max_connections)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers < 1:
+            raise ValueError('workers must be greater than 0')
+        if processes and not hasattr(os, 'fork'):
+            raise TCPError('worker processes are not supported on this platform')
+        if reuse_port and not hasattr(__socket__, 'SO_REUSEPORT'):
+            raise TCPError('SO_REUSEPORT is not supported on this platform')
+        self._nworkers = workers
+        self._processes = processes
+        self._reuse_port = reuse_port
+        self._index = 0
+        self._master = None
+        self._sock = None
+        self._workers = []
+        # Connection count for each worker, shared with worker processes
+        self._counts = mmap.mmap(-1, 8 * workers)
+
+    @property
+    def connection_count(self):
+        """Number of active connections across all workers"""
+        return sum(struct.unpack_from('%dq' % self._nworkers, self._counts))
+
+    def serve(self, backlog=None):
+        try:
+            super(MultiTCPServer, self).serve(backlog)
+        finally:
+            if self._master is None:
+                self._join_workers()
+
+    def close(self):
+        if self._closed:
+            return
+        super(MultiTCPServer, self).close()
+        if self._master is None:
+            self._stop_workers()
+
+    def _bind(self, address):
+        family = __socket__.AF_INET6 if ':' in address[0] else __socket__.AF_INET
+        sock = __socket__.socket(family, __socket__.SOCK_STREAM)
+        try:
+            sock.setsockopt(__socket__.SOL_SOCKET, __socket__.SO_REUSEADDR, 1)
+            if self._reuse_port:
+                sock.setsockopt(__socket__.SOL_SOCKET, __socket__.SO_REUSEPORT, 1)
+            sock.bind(address)
+            # libuv doesn't change the blocking mode of opened sockets
+            sock.setblocking(False)
+            self._handle.open(os.dup(sock.fileno()))
+        except __socket__.error as e:
+            sock.close()
+            raise TCPError(e.args[0], e.args[-1])
+        self._sock = sock
+
+    def _serve(self, backlog):
+        if self._master is None:
+            self._start_workers(backlog)
+        super(MultiTCPServer, self)._serve(backlog)
+
+    def _close(self):
+        super(MultiTCPServer, self)._close()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _add_connection(self, connection):
+        super(MultiTCPServer, self)._add_connection(connection)
+        struct.pack_into('q', self._counts, 8 * self._index, len(self.connections))
+
+    def _remove_connection(self, connection):
+        super(MultiTCPServer, self)._remove_connection(connection)
+        struct.pack_into('q', self._counts, 8 * self._index, len(self.connections))
+
+    # worker management, these run in the master
+
+    def _start_workers(self, backlog):
+        if self._sock is None:
+            raise TCPError('server is not bound')
+        for index in range(1, self._nworkers):
+            if self._processes:
+                rfd, wfd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(wfd)
+                    for _, fd in self._workers:
+                        os.close(fd)
+                    self._run_worker_process(index, backlog, rfd)
+                os.close(rfd)
+                self._workers.append((pid, wfd))
+            else:
+                started = threading.Event()
+                worker = {}
+                thread = threading.Thread(target=self._run_worker, args=(index, backlog, worker, started))
+                thread.daemon = True
+                thread.start()
+                started.wait()
+                self._workers.append((thread, worker))
+
+    def _stop_workers(self):
+        for worker, info in self._workers:
+            if self._processes:
+                # the worker stops once it sees EOF on its end of the pipe
+                os.close(info)
+            elif 'loop' in info:
+                try:
+                    info['loop'].call_from_thread(info['server'].close)
+                except Exception:
+                    # the worker loop is already gone
+                    pass
+
+    def _join_workers(self):
+        loop = evergreen.current.loop
+        workers, self._workers = self._workers, []
+        for worker, info in workers:
+            if self._processes:
+                loop._threadpool.spawn(os.waitpid, worker, 0).get()
+            else:
+                loop._threadpool.spawn(worker.join).get()
+
+    # these run in the workers
+
+    def _run_worker_process(self, index, backlog, stop_fd):
+        # This is the child process, the master's loop must not be used here
+        try:
+            worker = {}
+            thread = threading.Thread(target=self._run_worker, args=(index, backlog, worker, None, stop_fd))
+            thread.start()
+            thread.join()
+        finally:
+            os._exit(0)
+
+    def _run_worker(self, index, backlog, info, started, stop_fd=None):
+        loop = evergreen.EventLoop()
+        try:
+            server = self._create_worker(index)
+            info['loop'] = loop
+            info['server'] = server
+            if started is not None:
+                started.set()
+            if stop_fd is not None:
+                evergreen.spawn(server._wait_for_stop, stop_fd)
+            evergreen.spawn(server.serve, backlog)
+            loop.run()
+        finally:
+            if started is not None:
+                started.set()
+            loop.destroy()
+
+    def _create_worker(self, index):
+        server = copy.copy(self)
+        TCPServer.__init__(server, self.max_connections)
+        server._index = index
+        server._master = self
+        server._workers = []
+        if self._reuse_port:
+            server._bind(self._sock.getsockname())
         else:
-            conn = self.connection_cls(tcp_handle)
-            conn._set_accepted(self)
-            self.handle_connection(conn)
+            server._sock = None
+            server._handle.open(os.dup(self._sock.fileno()))
+        return server
 
+    def _wait_for_stop(self, fd):
+        stream = PipeStream()
+        stream.open(fd)
+        stream.read_bytes(1)
+        stream.close()
+        self.close()
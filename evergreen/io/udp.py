@@ -2,13 +2,17 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
+import functools
 import pyuv
 
+from collections import deque
+
 import evergreen
 from evergreen.core.utils import Result
 from evergreen.event import Event
 from evergreen.io import errno
 from evergreen.log import log
+from evergreen.timeout import Timeout
 
 __all__ = ['UDPEndpoint', 'UDPError']
 
@@ -18,15 +22,42 @@ UDPError = pyuv.error.UDPError
 
 class UDPEndpoint(object):
 
+    WRITE_HIGH_WATER = 64*1024
+    RECEIVE_QUEUE_SIZE = 1024
+
     def __init__(self):
         loop = evergreen.current.loop
         self._handle = pyuv.UDP(loop._loop)
         self._closed = False
         self._receive_result = Result()
+        self._continuous_receive = False
+        self._receiving = False
+        self._receive_waiting = False
+        self._receive_queue = deque()
+        self._receive_queue_size = self.RECEIVE_QUEUE_SIZE
+        self._receive_exc = None
+        self._receive_handler = None
+        self._dropped = 0
         self._pending_writes = 0
         self._flush_event = Event()
         self._flush_event.set()
         self._sockname = None
+        # pyuv doesn't expose the size of the send queue, so keep track of it ourselves,
+        # requests complete in order
+        self._send_sizes = deque()
+        self._write_buffer_size = 0
+        self._write_high_water = self.WRITE_HIGH_WATER
+        self._write_low_water = self.WRITE_HIGH_WATER // 4
+        self._drain_event = Event()
+        self._drain_event.set()
+
+    @property
+    def write_buffer_size(self):
+        return self._write_buffer_size
+
+    @property
+    def dropped(self):
+        return self._dropped
 
     @property
     def sockname(self):
@@ -39,40 +70,219 @@ class UDPEndpoint(object):
         self._check_closed()
         self._handle.bind(addr)
 
+    def join_group(self, group, interface=None):
+        self._check_closed()
+        if interface is None:
+            self._handle.set_membership(group, pyuv.UV_JOIN_GROUP)
+        else:
+            self._handle.set_membership(group, pyuv.UV_JOIN_GROUP, interface)
+
+    def leave_group(self, group, interface=None):
+        self._check_closed()
+        if interface is None:
+            self._handle.set_membership(group, pyuv.UV_LEAVE_GROUP)
+        else:
+            self._handle.set_membership(group, pyuv.UV_LEAVE_GROUP, interface)
+
+    def set_multicast_ttl(self, ttl):
+        self._check_closed()
+        self._handle.set_multicast_ttl(ttl)
+
+    def set_multicast_loop(self, enabled):
+        self._check_closed()
+        self._handle.set_multicast_loop(bool(enabled))
+
+    def set_multicast_interface(self, interface):
+        self._check_closed()
+        try:
+            func = self._handle.set_multicast_interface
+        except AttributeError:
+            # not available in older pyuv versions
+            raise UDPError(errno.ENOTSUP, errno.strerror(errno.ENOTSUP))
+        func(interface)
+
+    def set_broadcast(self, enabled):
+        self._check_closed()
+        self._handle.set_broadcast(bool(enabled))
+
+    def set_ttl(self, ttl):
+        self._check_closed()
+        self._handle.set_ttl(ttl)
+
     def send(self, data, addr):
         self._check_closed()
         self._handle.send(addr, data, self.__send_cb)
-        if self._pending_writes == 0:
-            self._flush_event.clear()
-        self._pending_writes += 1
+        self._add_pending_send(len(data))
+
+    def send_many(self, datagrams):
+        self._check_closed()
+        # A single entry in the send queue accounts for the whole batch, it's completed
+        # when the last datagram has been sent
+        pending = [0]
+        size = 0
+        cb = functools.partial(self.__send_many_cb, pending)
+        try:
+            for data, addr in datagrams:
+                self._handle.send(addr, data, cb)
+                pending[0] += 1
+                size += len(data)
+        finally:
+            if pending[0]:
+                self._add_pending_send(size)
 
     def receive(self):
         self._check_closed()
+        if self._receive_queue:
+            return self._receive_queue.popleft()
+        if self._continuous_receive:
+            self._wait_datagrams(None)
+            return self._receive_queue.popleft()
         with self._receive_result:
             self._handle.start_recv(self.__receive_cb)
-            return self._receive_result.get()
+            try:
+                return self._receive_result.get()
+            except BaseException:
+                if not self._handle.closed:
+                    self._handle.stop_recv()
+                raise
+
+    def receive_many(self, max_n, timeout=None):
+        self._check_closed()
+        if max_n < 1:
+            raise ValueError('max_n must be greater than 0')
+        queue = self._receive_queue
+        if not queue:
+            try:
+                if not self._wait_datagrams(timeout):
+                    return []
+            finally:
+                if not self._continuous_receive and self._receiving:
+                    self._stop_receiving()
+        return [queue.popleft() for x in range(min(max_n, len(queue)))]
+
+    def set_continuous_receive(self, enabled, queue_size=None):
+        self._check_closed()
+        if queue_size is not None:
+            if queue_size <= 0:
+                raise ValueError('queue_size must be greater than 0')
+            self._receive_queue_size = queue_size
+        self._continuous_receive = bool(enabled)
+        if self._continuous_receive:
+            if not self._receiving and self._receive_exc is None:
+                self._start_receiving()
+        elif self._receiving:
+            self._stop_receiving()
 
     def flush(self):
         self._check_closed()
         self._flush_event.wait()
 
+    def drain(self):
+        self._check_closed()
+        if self._write_buffer_size > self._write_high_water:
+            self._drain_event.clear()
+            self._drain_event.wait()
+            self._check_closed()
+
+    def set_write_watermarks(self, high=None, low=None):
+        if high is None:
+            high = self.WRITE_HIGH_WATER if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError('high (%r) must be >= low (%r) must be >= 0' % (high, low))
+        self._write_high_water = high
+        self._write_low_water = low
+
     def close(self):
         if self._closed:
             return
         self._closed = True
+        self._receiving = False
+        if self._receive_handler is not None:
+            self._receive_handler.cancel()
+            self._receive_handler = None
         self._handle.close()
+        self._drain_event.set()
+        if self._receive_waiting:
+            self._receive_waiting = False
+            self._receive_result.set_exception(UDPError('endpoint is closed'))
 
     def _check_closed(self):
         if self._closed:
             raise UDPError('endpoint is closed')
 
-    def __send_cb(self, handle, error):
+    def _wait_datagrams(self, timeout):
+        # Wait until there is at least one datagram in the queue, returns False on timeout.
+        # A receive error is raised once the datagrams queued before it were consumed.
+        timer = Timeout(timeout) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            while True:
+                with self._receive_result:
+                    # another consumer may have filled the queue while this one was
+                    # waiting for the lock, or the wakeup may have been for an error
+                    if self._receive_queue:
+                        break
+                    self._check_closed()
+                    if self._receive_exc is not None:
+                        exc, self._receive_exc = self._receive_exc, None
+                        raise exc
+                    if not self._receiving:
+                        self._start_receiving()
+                    self._receive_waiting = True
+                    try:
+                        self._receive_result.get()
+                    finally:
+                        self._receive_waiting = False
+        except Timeout as e:
+            if e is not timer:
+                raise
+            return False
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return True
+
+    def _start_receiving(self):
+        self._handle.start_recv(self.__queue_receive_cb)
+        self._receiving = True
+
+    def _stop_receiving(self):
+        self._receiving = False
+        self._handle.stop_recv()
+
+    def _add_pending_send(self, size):
+        if self._pending_writes == 0:
+            self._flush_event.clear()
+        self._pending_writes += 1
+        self._send_sizes.append(size)
+        self._write_buffer_size += size
+
+    def _send_done(self):
         self._pending_writes -= 1
         if self._pending_writes == 0:
             self._flush_event.set()
+        self._write_buffer_size -= self._send_sizes.popleft()
+        if not self._drain_event.is_set() and self._write_buffer_size <= self._write_low_water:
+            self._drain_event.set()
+
+    def _send_failed(self, error):
+        log.debug('send failed: %d %s', error, pyuv.errno.strerror(error))
+        evergreen.current.loop.call_soon(self.close)
+
+    def __send_cb(self, handle, error):
+        self._send_done()
         if error is not None:
-            log.debug('send failed: %d %s', error, pyuv.errno.strerror(error))
-            evergreen.current.loop.call_soon(self.close)
+            self._send_failed(error)
+
+    def __send_many_cb(self, pending, handle, error):
+        pending[0] -= 1
+        if pending[0] == 0:
+            self._send_done()
+        if error is not None:
+            self._send_failed(error)
 
     def __receive_cb(self, handle, addr, flags, data, error):
         self._handle.stop_recv()
@@ -81,3 +291,22 @@ class UDPEndpoint(object):
         else:
             self._receive_result.set_value((data, addr))
 
+    def __queue_receive_cb(self, handle, addr, flags, data, error):
+        if error is not None:
+            self._receive_exc = UDPError(error, errno.strerror(error))
+            self._stop_receiving()
+        elif len(self._receive_queue) < self._receive_queue_size:
+            self._receive_queue.append((data, addr))
+        else:
+            self._dropped += 1
+            return
+        # libuv reads several datagrams per loop iteration, wake up the waiter once they
+        # have all been queued
+        if self._receive_waiting and self._receive_handler is None:
+            self._receive_handler = evergreen.current.loop.call_soon(self.__wakeup_receiver)
+
+    def __wakeup_receiver(self):
+        self._receive_handler = None
+        if self._receive_waiting:
+            self._receive_waiting = False
+            self._receive_result.set_value(None)
@@ -2,81 +2,137 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
-from collections import deque
-
 __all__ = ['StringBuffer']
 
 
+# Consumed data is discarded once at least this amount of bytes were consumed and
+# they make up at least half of the buffer
+_COMPACT_MIN = 64*1024
+
+# Maximum number of delimiters for which the scan position is remembered
+_MAX_SCAN_CURSORS = 16
+
+
 class StringBuffer(object):
+    """Read buffer for streams. Data is kept in a single bytearray together with the
+    offset where the next read starts, consumed data is discarded lazily.
+    """
 
     def __init__(self, max_size=100*1024*1024):
         self._max_size = max_size
-        self._buf = deque()
-        self._size = 0
+        self._buf = bytearray()
+        self._pos = 0
+        self._scan_pos = {}
         self._closed = False
 
     @property
     def closed(self):
         return self._closed
 
+    @property
+    def size(self):
+        return len(self._buf) - self._pos
+
     def read(self, nbytes):
         self._check_closed()
-        if self._size >= nbytes:
+        if self.size >= nbytes:
             return self._consume(nbytes)
         return None
 
-    def read_until(self, delimiter):
-        # Multi-byte delimiters (e.g. '\r\n') may straddle two
-        # chunks in the read buffer, so we can't easily find them
-        # without collapsing the buffer. However, since protocols
-        # using delimited reads (as opposed to reads of a known
-        # length) tend to be "line" oriented, the delimiter is likely
-        # to be in the first few chunks. Merge the buffer gradually
-        # since large merges are relatively expensive and get undone in
-        # consume().
+    def read_into(self, buf):
+        """Copy up to len(buf) bytes into the given writable buffer and return the number
+        of bytes copied.
+        """
+        self._check_closed()
+        view = memoryview(buf)
+        nbytes = min(len(view), self.size)
+        if nbytes:
+            src = memoryview(self._buf)
+            view[:nbytes] = src[self._pos:self._pos+nbytes]
+            del src
+            self._advance(nbytes)
+        return nbytes
+
+    def peek(self, nbytes=None):
+        """Return a memoryview over (up to nbytes of) the buffered data, without consuming
+        it. The view must be released (or simply dropped) before the buffer is modified.
+        """
         self._check_closed()
-        if self._buf:
-            while True:
-                loc = self._buf[0].find(delimiter)
-                if loc != -1:
-                    delimiter_len = len(delimiter)
-                    return self._consume(loc + delimiter_len)
-                if len(self._buf) == 1:
-                    break
-                self._double_prefix()
+        end = len(self._buf) if nbytes is None else min(len(self._buf), self._pos + nbytes)
+        return memoryview(self._buf)[self._pos:end]
+
+    def read_until(self, delimiter, max_bytes=None):
+        # Remember how far we scanned for each delimiter, so new data arriving in
+        # small chunks doesn't make us search the entire buffer again.
+        self._check_closed()
+        pos = self._pos
+        start = self._scan_pos.get(delimiter, 0)
+        if start < pos:
+            start = pos
+        loc = self._buf.find(delimiter, start)
+        if loc != -1:
+            nbytes = loc - pos + len(delimiter)
+            if max_bytes is not None and nbytes > max_bytes:
+                self._max_bytes_exceeded(max_bytes)
+            return self._consume(nbytes)
+        if max_bytes is not None and len(self._buf) - pos >= max_bytes:
+            self._max_bytes_exceeded(max_bytes)
+        if delimiter not in self._scan_pos and len(self._scan_pos) >= _MAX_SCAN_CURSORS:
+            self._scan_pos.clear()
+        self._scan_pos[delimiter] = max(pos, len(self._buf) - len(delimiter) + 1)
         return None
 
-    def read_until_regex(self, regex):
-        # regex must be a compiled re object
+    def read_until_regex(self, regex, max_bytes=None):
+        # regex must be a compiled re object. Regular expressions may use anchors or
+        # lookbehind assertions, so they can't be resumed from where the last search
+        # stopped and are always matched against all buffered data.
         self._check_closed()
-        if self._buf:
-            while True:
-                m = regex.search(self._buf[0])
-                if m is not None:
-                    return self._consume(m.end())
-                if len(self._buf) == 1:
-                    break
-                self._double_prefix()
+        if self._pos:
+            self._compact()
+        m = regex.search(self._buf)
+        if m is not None:
+            nbytes = m.end()
+            if max_bytes is not None and nbytes > max_bytes:
+                self._max_bytes_exceeded(max_bytes)
+            return self._consume(nbytes)
+        if max_bytes is not None and len(self._buf) >= max_bytes:
+            self._max_bytes_exceeded(max_bytes)
         return None
 
+    def read_frame(self, header, max_size=None):
+        # header must be a struct.Struct object with a single integer field, which
+        # holds the length of the payload following it
+        self._check_closed()
+        pos = self._pos
+        available = len(self._buf) - pos
+        if available < header.size:
+            return None
+        length = header.unpack_from(self._buf, pos)[0]
+        if length < 0:
+            raise IOError('invalid frame length: %d' % length)
+        if max_size is not None and length > max_size:
+            raise IOError('frame too large: %d bytes' % length)
+        if available - header.size < length:
+            return None
+        self._advance(header.size)
+        return self._consume(length)
+
     def feed(self, chunk):
         self._check_closed()
-        self._buf.append(chunk)
-        self._size += len(chunk)
-        if self._size >= self._max_size:
+        buf = self._buf
+        buf += chunk
+        if len(buf) - self._pos >= self._max_size:
             self.close()
             raise IOError('Maximum buffer size reached')
 
     def clear(self):
         self._check_closed()
-        self._buf.clear()
-        self._size = 0
+        self._reset()
 
     def close(self):
         if not self._closed:
             self._closed = True
-            self._buf.clear()
-            self._size = 0
+            self._reset()
 
     # internal
 
@@ -84,52 +140,35 @@ class StringBuffer(object):
         if self._closed:
             raise ValueError('I/O operation on closed buffer')
 
-    def _consume(self, loc):
-        if loc == 0:
+    def _consume(self, nbytes):
+        if nbytes == 0:
             return b''
-        self._merge_prefix(loc)
-        self._size -= loc
-        return self._buf.popleft()
-
-    def _double_prefix(self):
-        """Grow the given deque by doubling, but don't split the second chunk just
-        because the first one is small.
-        """
-        new_len = max(len(self._buf[0]) * 2, (len(self._buf[0]) + len(self._buf[1])))
-        self._merge_prefix(new_len)
-
-    def _merge_prefix(self, size):
-        """Replace the first entries in a deque of strings with a single
-        string of up to size bytes.
-
-        >>> d = collections.deque(['abc', 'de', 'fghi', 'j'])
-        >>> _merge_prefix(d, 5); print(d)
-        deque(['abcde', 'fghi', 'j'])
-
-        Strings will be split as necessary to reach the desired size.
-        >>> _merge_prefix(d, 7); print(d)
-        deque(['abcdefg', 'hi', 'j'])
-
-        >>> _merge_prefix(d, 3); print(d)
-        deque(['abc', 'defg', 'hi', 'j'])
-
-        >>> _merge_prefix(d, 100); print(d)
-        deque(['abcdefghij'])
-        """
-        if len(self._buf) == 1 and len(self._buf[0]) <= size:
-            return
-        prefix = []
-        remaining = size
-        while self._buf and remaining > 0:
-            chunk = self._buf.popleft()
-            if len(chunk) > remaining:
-                self._buf.appendleft(chunk[remaining:])
-                chunk = chunk[:remaining]
-            prefix.append(chunk)
-            remaining -= len(chunk)
-        if prefix:
-            self._buf.appendleft(b''.join(prefix))
-        if not self._buf:
-            self._buf.appendleft(b'')
-
+        pos = self._pos
+        data = memoryview(self._buf)[pos:pos+nbytes].tobytes()
+        self._advance(nbytes)
+        return data
+
+    def _advance(self, nbytes):
+        pos = self._pos = self._pos + nbytes
+        if pos >= _COMPACT_MIN and pos * 2 >= len(self._buf):
+            self._compact()
+
+    def _compact(self):
+        pos = self._pos
+        if pos == len(self._buf):
+            self._buf = bytearray()
+            self._scan_pos.clear()
+        else:
+            del self._buf[:pos]
+            for delimiter, scan_pos in list(self._scan_pos.items()):
+                self._scan_pos[delimiter] = max(0, scan_pos - pos)
+        self._pos = 0
+
+    def _max_bytes_exceeded(self, max_bytes):
+        raise IOError('delimiter not found within %d bytes' % max_bytes)
+
+    def _reset(self):
+        self._buf = bytearray()
+        self._pos = 0
+        self._scan_pos = {}
 
@@ -0,0 +1,189 @@
+#
+# This file is part of Evergreen. See the NOTICE for more information.
+#
+
+import os
+import pyuv
+import six
+
+import evergreen
+from evergreen.event import Event
+from evergreen.io import errno
+
+__all__ = ['FSWatcher', 'FSPoller', 'FSEventError', 'FSPollError']
+
+
+FSEventError = pyuv.error.FSEventError
+FSPollError = pyuv.error.FSPollError
+
+
+class _BaseWatcher(object):
+    """Changes are collected until no new ones arrive for *debounce* seconds (but no
+    longer than *max_delay* seconds since the first one), and then handed out together.
+    """
+
+    def __init__(self, debounce, max_delay):
+        if debounce < 0:
+            raise ValueError('debounce must be 0 or greater')
+        if max_delay < debounce:
+            raise ValueError('max_delay must be greater than or equal to debounce')
+        self._loop = evergreen.current.loop
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._first_change = None
+        self._flush_handler = None
+        self._ready = Event()
+        self._error = None
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def get(self, timeout=None):
+        if not self._ready.wait(timeout) or self._closed:
+            return self._no_changes()
+        if self._error is not None:
+            self._ready.clear()
+            exc, self._error = self._error, None
+            raise exc
+        self._ready.clear()
+        return self._take()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_handler is not None:
+            self._flush_handler.cancel()
+            self._flush_handler = None
+        self._handle.close()
+        # wake up the waiters, they get nothing
+        self._ready.set()
+
+    def _changed(self):
+        now = self._loop.time()
+        if self._first_change is None:
+            self._first_change = now
+        if self._flush_handler is not None:
+            self._flush_handler.cancel()
+        delay = min(now + self._debounce, self._first_change + self._max_delay) - now
+        self._flush_handler = self._loop.call_later(max(delay, 0), self.__flush)
+
+    def _set_error(self, error):
+        self._error = error
+        self._ready.set()
+
+    def _no_changes(self):
+        return None
+
+    def _take(self):
+        raise NotImplementedError
+
+    def __flush(self):
+        self._flush_handler = None
+        self._first_change = None
+        self._ready.set()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while not self._closed:
+            changes = self.get()
+            if changes:
+                return changes
+        raise StopIteration
+
+    if six.PY3:
+        __next__ = next
+        del next
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, tb):
+        self.close()
+
+
+class FSWatcher(_BaseWatcher):
+    """Watch a file or directory for changes, using the notification mechanism of the
+    platform (inotify, kqueue, ...).
+    """
+
+    CHANGE = pyuv.fs.UV_CHANGE
+    RENAME = pyuv.fs.UV_RENAME
+
+    def __init__(self, path, debounce=0.1, max_delay=1.0):
+        super(FSWatcher, self).__init__(debounce, max_delay)
+        self._changes = {}
+        self._order = []
+        self._handle = pyuv.fs.FSEvent(self._loop._loop, path, self.__event_cb, 0)
+        self.path = path
+
+    def _no_changes(self):
+        # a new list every time, callers may modify it
+        return []
+
+    def _take(self):
+        changes = [(filename, self._changes[filename]) for filename in self._order]
+        self._changes = {}
+        self._order = []
+        return changes
+
+    def __event_cb(self, handle, filename, events, error):
+        if error is not None:
+            self._set_error(FSEventError(error, errno.strerror(error)))
+            return
+        if filename in self._changes:
+            self._changes[filename] |= events
+        else:
+            self._changes[filename] = events
+            self._order.append(filename)
+        self._changed()
+
+
+class FSPoller(_BaseWatcher):
+    """Watch a file for changes by checking its stat information every *interval*
+    seconds. It's slower than FSWatcher, but it works on any file system.
+    """
+
+    def __init__(self, path, interval=1.0, debounce=0.1, max_delay=1.0):
+        super(FSPoller, self).__init__(debounce, max_delay)
+        self._prev = self._curr = None
+        self._pending = False
+        # FSPoll doesn't hand out the stat information it starts from, it's needed to
+        # report the removal of a file which didn't change before
+        try:
+            self._last_stat = os.stat(path)
+        except OSError:
+            self._last_stat = None
+        self._handle = pyuv.fs.FSPoll(self._loop._loop)
+        self._handle.start(path, self.__poll_cb, interval)
+        self.path = path
+
+    def _take(self):
+        if not self._pending:
+            return None
+        self._pending = False
+        changes = (self._prev, self._curr)
+        self._prev = self._curr = None
+        return changes
+
+    def __poll_cb(self, handle, prev_stat, curr_stat, error):
+        if error is not None:
+            if error != errno.ENOENT:
+                self._set_error(FSPollError(error, errno.strerror(error)))
+                return
+            if self._last_stat is None:
+                # the file didn't exist in the first place
+                return
+            # the file was removed, report it as a change with no current stat information
+            prev_stat, curr_stat = self._last_stat, None
+        self._last_stat = curr_stat
+        if not self._pending:
+            self._prev = prev_stat
+            self._pending = True
+        self._curr = curr_stat
+        self._changed()
+
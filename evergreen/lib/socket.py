@@ -4,6 +4,7 @@
 
 from __future__ import absolute_import
 
+import io
 import os
 import _socket
 import sys
@@ -12,6 +13,9 @@ import warnings
 import six
 import evergreen
 
+from fibers import Fiber
+
+from evergreen.core.resolver import _interleave_addrinfos
 from evergreen.event import Event
 from evergreen.patcher import slurp_properties
 from evergreen.timeout import Timeout
@@ -95,11 +99,29 @@ except AttributeError:
     _GLOBAL_DEFAULT_TIMEOUT = object()
 
 
-def _get_memory(string, offset):
+# Python 3 clears the exception automatically
+_exc_clear = getattr(sys, 'exc_clear', lambda: None)
+
+
+# Maximum number of buffers passed to a single sendmsg call
+_IOV_MAX = 1024
+
+
+def _byte_view(data):
+    if isinstance(data, six.text_type):
+        data = data.encode()
     try:
-        return memoryview(string)[offset:]
+        view = memoryview(data)
     except TypeError:
-        return buffer(string, offset)
+        return buffer(data)
+    if view.itemsize != 1:
+        view = view.cast('B')
+    return view
+
+
+def _socktype(sock):
+    # Before Python 3.7 the type includes flags such as SOCK_NONBLOCK on Linux
+    return sock.type & ~(getattr(__socket__, 'SOCK_NONBLOCK', 0) | getattr(__socket__, 'SOCK_CLOEXEC', 0))
 
 
 class _closedsocket(object):
@@ -116,52 +138,102 @@ cancel_wait_ex = error(EBADF, 'File descriptor was closed by another task')
 
 
 class IOHandler(object):
+    """Waits for a file descriptor to become readable or writable. It uses the loop's poll
+    handle for the fd (the same one used by select and add_reader / add_writer) and keeps
+    it open for the lifetime of the object, so it's not created and closed on every wait.
+    """
 
     def __init__(self, fd):
         self.fd = fd
         self._read_closed = False
         self._write_closed = False
-        self._read_event = Event()
-        self._write_event = Event()
+        self._loop = None
+        self._read_waiter = None
+        self._write_waiter = None
+        self._read_handler = None
+        self._write_handler = None
 
     def wait_read(self, timeout=None, timeout_exc=None):
         if self._read_closed:
             raise cancel_wait_ex
-        self._read_event.clear()
-        loop = evergreen.current.loop
-        loop.add_reader(self.fd, self._read_event.set)
+        loop = self._get_loop()
+        current = Fiber.current()
+        loop.add_reader(self.fd, current.switch)
+        self._read_waiter = current
         try:
-            self._wait(self._read_event, timeout, timeout_exc)
-            if self._read_closed:
-                raise cancel_wait_ex
+            self._wait(loop, timeout, timeout_exc)
         finally:
-            loop.remove_reader(self.fd)
+            if self._read_handler is not None:
+                self._read_handler.cancel()
+                self._read_handler = None
+            if self._read_waiter is current:
+                # Not woken up by close()
+                self._read_waiter = None
+                loop.remove_reader(self.fd)
+        if self._read_closed:
+            raise cancel_wait_ex
 
     def wait_write(self, timeout=None, timeout_exc=None):
         if self._write_closed:
             raise cancel_wait_ex
-        self._write_event.clear()
-        loop = evergreen.current.loop
-        loop.add_writer(self.fd, self._write_event.set)
+        loop = self._get_loop()
+        current = Fiber.current()
+        loop.add_writer(self.fd, current.switch)
+        self._write_waiter = current
         try:
-            self._wait(self._write_event, timeout, timeout_exc)
-            if self._write_closed:
-                raise cancel_wait_ex
+            self._wait(loop, timeout, timeout_exc)
         finally:
-            loop.remove_writer(self.fd)
+            if self._write_handler is not None:
+                self._write_handler.cancel()
+                self._write_handler = None
+            if self._write_waiter is current:
+                self._write_waiter = None
+                loop.remove_writer(self.fd)
+        if self._write_closed:
+            raise cancel_wait_ex
 
     def close(self, read=True, write=True):
+        loop = self._loop
         if read:
             self._read_closed = True
-            self._read_event.set()
+            waiter, self._read_waiter = self._read_waiter, None
+            if waiter is not None:
+                loop.remove_reader(self.fd)
+                self._read_handler = loop.call_soon(waiter.switch)
         if write:
             self._write_closed = True
-            self._write_event.set()
-
-    def _wait(self, event, timeout, timeout_exc):
-            r = event.wait(timeout)
-            if not r and timeout_exc:
+            waiter, self._write_waiter = self._write_waiter, None
+            if waiter is not None:
+                loop.remove_writer(self.fd)
+                self._write_handler = loop.call_soon(waiter.switch)
+        if self._read_closed and self._write_closed and loop is not None:
+            loop._unref_fd(self.fd)
+            self._loop = None
+
+    def _get_loop(self):
+        loop = evergreen.current.loop
+        if self._loop is not loop:
+            if self._loop is not None:
+                self._loop._unref_fd(self.fd)
+            loop._ref_fd(self.fd)
+            self._loop = loop
+        return loop
+
+    def _wait(self, loop, timeout, timeout_exc):
+        if timeout is None:
+            loop.switch()
+            return
+        timer = Timeout(timeout)
+        timer.start()
+        try:
+            loop.switch()
+        except Timeout as e:
+            if e is not timer:
+                raise
+            if timeout_exc is not None:
                 raise timeout_exc
+        finally:
+            timer.cancel()
 
     def __repr__(self):
         return '<%s fd=%d>' % (self.__class__.__name__, self.fd)
@@ -238,7 +310,7 @@ class socket(object):
                 if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                     raise
                 del ex
-                six.exc_clear()
+                _exc_clear()
             self._io.wait_read(timeout=self.timeout, timeout_exc=timeout('timed out'))
         return socket(_sock=client_socket), address
 
@@ -265,7 +337,7 @@ class socket(object):
             return self._sock.connect(address)
         sock = self._sock
         if isinstance(address, tuple):
-            r = getaddrinfo(address[0], address[1], sock.family, sock.type, sock.proto)
+            r = getaddrinfo(address[0], address[1], sock.family, _socktype(sock), sock.proto)
             address = r[0][-1]
         timer = Timeout(self.timeout, timeout('timed out'))
         timer.start()
@@ -325,7 +397,7 @@ class socket(object):
                 if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                     raise
                 del ex
-                six.exc_clear()
+                _exc_clear()
             self._io.wait_read(timeout=self.timeout, timeout_exc=timeout('timed out'))
 
     def recvfrom(self, *args):
@@ -338,7 +410,7 @@ class socket(object):
                 if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                     raise
                 del ex
-                six.exc_clear()
+                _exc_clear()
             self._io.wait_read(timeout=self.timeout, timeout_exc=timeout('timed out'))
 
     def recvfrom_into(self, *args):
@@ -351,7 +423,7 @@ class socket(object):
                 if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                     raise
                 del ex
-                six.exc_clear()
+                _exc_clear()
             self._io.wait_read(timeout=self.timeout, timeout_exc=timeout('timed out'))
 
     def recv_into(self, *args):
@@ -364,7 +436,7 @@ class socket(object):
                 if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                     raise
                 del ex
-                six.exc_clear()
+                _exc_clear()
             self._io.wait_read(timeout=self.timeout, timeout_exc=timeout('timed out'))
 
     def send(self, data, flags=0):
@@ -376,7 +448,7 @@ class socket(object):
             if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                 raise
             del ex
-            six.exc_clear()
+            _exc_clear()
             self._io.wait_write(timeout=self.timeout, timeout_exc=timeout('timed out'))
             try:
                 return sock.send(data, flags)
@@ -387,24 +459,153 @@ class socket(object):
                 raise
 
     def sendall(self, data, flags=0):
-        if isinstance(data, six.text_type):
-            data = data.encode()
-        if self.timeout is None:
-            data_sent = 0
-            while data_sent < len(data):
-                data_sent += self.send(_get_memory(data, data_sent), flags)
+        """Send all the data. *data* may also be a list or tuple of buffers, which are
+        sent using scatter-gather I/O if the platform supports it.
+        """
+        if isinstance(data, (list, tuple)):
+            send = self._send_buffers
+            # bytes already have a byte sized length, creating views for them is not free
+            data = [item if isinstance(item, bytes) else _byte_view(item) for item in data]
+        else:
+            send = self._send_buffer
+            data = _byte_view(data)
+        if not self.timeout:
+            send(data, flags)
         else:
             timer = Timeout(self.timeout, timeout('timed out'))
             timer.start()
             try:
-                data_sent = 0
-                while True:
-                    data_sent += self.send(_get_memory(data, data_sent), flags)
-                    if data_sent >= len(data):
-                        break
+                send(data, flags)
             finally:
                 timer.cancel()
 
+    def _send_buffer(self, data, flags):
+        # Keep writing while the kernel accepts data, only wait when it doesn't
+        sock = self._sock
+        total = len(data)
+        sent = 0
+        while sent < total:
+            try:
+                sent += sock.send(data[sent:] if sent else data, flags)
+            except error:
+                ex = sys.exc_info()[1]
+                if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
+                    raise
+                del ex
+                _exc_clear()
+                self._io.wait_write()
+
+    def _send_buffers(self, buffers, flags):
+        sock = self._sock
+        if not hasattr(sock, 'sendmsg'):
+            self._send_buffer(_byte_view(b''.join(buffers)), flags)
+            return
+        buffers = [item for item in buffers if len(item)]
+        i = 0
+        while i < len(buffers):
+            try:
+                sent = sock.sendmsg(buffers[i:i+_IOV_MAX], (), flags)
+            except error:
+                ex = sys.exc_info()[1]
+                if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
+                    raise
+                del ex
+                _exc_clear()
+                self._io.wait_write()
+                continue
+            # skip the buffers which were sent completely
+            while sent:
+                size = len(buffers[i])
+                if sent < size:
+                    # slice a view, slicing bytes would copy the rest of the item
+                    item = buffers[i]
+                    if isinstance(item, bytes):
+                        item = memoryview(item)
+                    buffers[i] = item[sent:]
+                    break
+                sent -= size
+                i += 1
+
+    if hasattr(_socket.socket, 'sendmsg'):
+        def sendmsg(self, buffers, *args):
+            sock = self._sock
+            buffers = list(buffers)
+            while True:
+                try:
+                    return sock.sendmsg(buffers, *args)
+                except error:
+                    ex = sys.exc_info()[1]
+                    if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
+                        raise
+                    del ex
+                    _exc_clear()
+                self._io.wait_write(timeout=self.timeout, timeout_exc=timeout('timed out'))
+
+    def sendfile(self, file, offset=0, count=None):
+        """Send the contents of *file* (opened in binary mode) until EOF is reached, or
+        *count* bytes were sent, starting at *offset*. os.sendfile is used if available,
+        so data doesn't need to be copied to user space. Returns the number of bytes sent.
+        """
+        try:
+            fileno = file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            fileno = None
+        if fileno is None or not hasattr(os, 'sendfile') or _socktype(self) != SOCK_STREAM:
+            return self._sendfile_use_send(file, offset, count)
+        if count is not None and count <= 0:
+            raise ValueError('count must be a positive integer (got %r)' % count)
+        if self.timeout == 0.0:
+            raise ValueError('non-blocking sockets are not supported')
+        sockno = self.fileno()
+        blocksize = count or max(os.fstat(fileno).st_size, 1)
+        blocksize = min(blocksize, 2**30)
+        timer = None
+        if self.timeout:
+            timer = Timeout(self.timeout, timeout('timed out'))
+            timer.start()
+        total = 0
+        try:
+            while True:
+                if count is not None:
+                    blocksize = min(count - total, blocksize)
+                    if blocksize <= 0:
+                        break
+                try:
+                    sent = os.sendfile(sockno, fileno, offset, blocksize)
+                except OSError:
+                    ex = sys.exc_info()[1]
+                    if ex.args[0] != EAGAIN:
+                        raise
+                    del ex
+                    _exc_clear()
+                    self._io.wait_write()
+                    continue
+                if sent == 0:
+                    break  # EOF
+                offset += sent
+                total += sent
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if total > 0 and hasattr(file, 'seek'):
+                file.seek(offset)
+        return total
+
+    def _sendfile_use_send(self, file, offset, count):
+        if count is not None and count <= 0:
+            raise ValueError('count must be a positive integer (got %r)' % count)
+        if offset:
+            file.seek(offset)
+        total = 0
+        while count is None or total < count:
+            size = 64*1024 if count is None else min(64*1024, count - total)
+            data = file.read(size)
+            if not data:
+                break
+            self.sendall(data)
+            total += len(data)
+        return total
+
     def sendto(self, *args):
         sock = self._sock
         try:
@@ -414,7 +615,7 @@ class socket(object):
             if ex.args[0] != EWOULDBLOCK or timeout == 0.0:
                 raise
             del ex
-            six.exc_clear()
+            _exc_clear()
             self._io.wait_write(timeout=self.timeout, timeout_exc=timeout('timed out'))
             try:
                 return sock.sendto(*args)
@@ -481,14 +682,14 @@ class socket(object):
 SocketType = socket
 
 
-def gethostbyname(*args, **kw):
+def gethostbyname(hostname):
     loop = evergreen.current.loop
-    return loop._threadpool.spawn(__socket__.gethostbyname, *args, **kw).get()
+    return loop.resolver.gethostbyname(hostname)
 
 
-def gethostbyname_ex(*args, **kw):
+def gethostbyname_ex(hostname):
     loop = evergreen.current.loop
-    return loop._threadpool.spawn(__socket__.gethostbyname_ex, *args, **kw).get()
+    return loop.resolver.gethostbyname_ex(hostname)
 
 
 def getnameinfo(*args, **kw):
@@ -496,12 +697,12 @@ def getnameinfo(*args, **kw):
     return loop._threadpool.spawn(__socket__.getnameinfo, *args, **kw).get()
 
 
-def getaddrinfo(*args, **kw):
+def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
     loop = evergreen.current.loop
-    return loop._threadpool.spawn(__socket__.getaddrinfo, *args, **kw).get()
+    return loop.resolver.getaddrinfo(host, port, family, type, proto, flags)
 
 
-def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT, source_address=None, happy_eyeballs_delay=None):
     """Connect to *address* and return the socket object.
 
     Convenience function.  Connect to *address* (a 2-tuple ``(host,
@@ -512,11 +713,16 @@ def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT, source_address=N
     is used. If *source_address* is set it must be a tuple of (host, port)
     for the socket to bind as a source address before making the connection.
     An host of '' or port 0 tells the OS to use the default.
+    If *happy_eyeballs_delay* is set, connection attempts are staggered by
+    that many seconds instead of being made one after another (RFC 8305).
     """
 
     host, port = address
+    infos = getaddrinfo(host, port, 0 if has_ipv6 else AF_INET, SOCK_STREAM)
+    if happy_eyeballs_delay is not None:
+        return _create_connection_staggered(_interleave_addrinfos(infos), timeout, source_address, happy_eyeballs_delay)
     err = None
-    for res in getaddrinfo(host, port, 0 if has_ipv6 else AF_INET, SOCK_STREAM):
+    for res in infos:
         af, socktype, proto, _canonname, sa = res
         sock = None
         try:
@@ -529,7 +735,7 @@ def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT, source_address=N
             return sock
         except error:
             err = sys.exc_info()[1]
-            six.exc_clear()
+            _exc_clear()
             if sock is not None:
                 sock.close()
     if err is not None:
@@ -538,6 +744,64 @@ def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT, source_address=N
         raise error("getaddrinfo returns an empty list")
 
 
+def _create_connection_staggered(infos, timeout, source_address, delay):
+    # Each attempt runs in its own task. A new one is started every *delay* seconds or as
+    # soon as one fails, the first socket to connect wins and the others are closed, which
+    # also aborts their pending connect.
+    state = {'sock': None, 'running': 0, 'done': False}
+    sockets = []
+    errors = []
+    progress = Event()
+
+    def attempt(res):
+        af, socktype, proto, _canonname, sa = res
+        if state['done']:
+            state['running'] -= 1
+            return
+        try:
+            sock = socket(af, socktype, proto)
+            sockets.append(sock)
+            if timeout is not _GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sa)
+        except error:
+            errors.append(sys.exc_info()[1])
+        else:
+            if state['sock'] is None:
+                state['sock'] = sock
+        finally:
+            state['running'] -= 1
+            progress.set()
+
+    try:
+        for res in infos:
+            progress.clear()
+            state['running'] += 1
+            evergreen.spawn(attempt, res)
+            progress.wait(delay)
+            if state['sock'] is not None:
+                break
+        while state['sock'] is None and state['running']:
+            progress.clear()
+            progress.wait()
+    except BaseException:
+        state['done'] = True
+        for sock in sockets:
+            sock.close()
+        raise
+    state['done'] = True
+    for sock in sockets:
+        if sock is not state['sock']:
+            sock.close()
+    if state['sock'] is not None:
+        return state['sock']
+    if errors:
+        raise errors[-1]
+    raise error("getaddrinfo returns an empty list")
+
+
 try:
     __original_fromfd__ = __socket__.fromfd
     def fromfd(*args):
@@ -550,7 +814,7 @@ try:
     __original_socketpair__ = __socket__.socketpair
     def socketpair(*args):
         one, two = __original_socketpair__(*args)
-        return socket(one), socket(two)
+        return socket(_sock=one), socket(_sock=two)
 except AttributeError:
     pass
 
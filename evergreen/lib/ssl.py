@@ -8,7 +8,7 @@ import errno
 import six
 import sys
 
-from evergreen.lib.socket import socket, _fileobject
+from evergreen.lib.socket import socket, _fileobject, _exc_clear
 from evergreen.lib.socket import error as socket_error, timeout as socket_timeout
 from evergreen.patcher import slurp_properties
 
@@ -115,12 +115,12 @@ class SSLSocket(socket):
                 elif ex.args[0] == SSL_ERROR_WANT_READ:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_read(timeout=self.timeout, timeout_exc=_SSLErrorReadTimeout)
                 elif ex.args[0] == SSL_ERROR_WANT_WRITE:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_write(timeout=self.timeout, timeout_exc=_SSLErrorReadTimeout)
                 else:
                     raise
@@ -136,12 +136,12 @@ class SSLSocket(socket):
                 if ex.args[0] == SSL_ERROR_WANT_READ:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_read(timeout=self.timeout, timeout_exc=_SSLErrorWriteTimeout)
                 elif ex.args[0] == SSL_ERROR_WANT_WRITE:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_write(timeout=self.timeout, timeout_exc=_SSLErrorWriteTimeout)
                 else:
                     raise
@@ -171,12 +171,12 @@ class SSLSocket(socket):
                     if x.args[0] == SSL_ERROR_WANT_READ:
                         if self.timeout == 0.0:
                             return 0
-                        six.exc_clear()
+                        _exc_clear()
                         self._io.wait_read(timeout=self.timeout, timeout_exc=socket_timeout('timed out'))
                     elif x.args[0] == SSL_ERROR_WANT_WRITE:
                         if self.timeout == 0.0:
                             return 0
-                        six.exc_clear()
+                        _exc_clear()
                         self._io.wait_write(timeout=self.timeout, timeout_exc=socket_timeout('timed out'))
                     else:
                         raise
@@ -219,7 +219,7 @@ class SSLSocket(socket):
                     if x.args[0] == SSL_ERROR_WANT_READ:
                         if self.timeout == 0.0:
                             raise
-                        six.exc_clear()
+                        _exc_clear()
                         self._io.wait_read(timeout=self.timeout, timeout_exc=socket_timeout('timed out'))
                         continue
                     else:
@@ -256,12 +256,12 @@ class SSLSocket(socket):
                 elif ex.args[0] == SSL_ERROR_WANT_READ:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_read(timeout=self.timeout, timeout_exc=_SSLErrorReadTimeout)
                 elif ex.args[0] == SSL_ERROR_WANT_WRITE:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_write(timeout=self.timeout, timeout_exc=_SSLErrorWriteTimeout)
                 else:
                     raise
@@ -295,12 +295,12 @@ class SSLSocket(socket):
                 if ex.args[0] == SSL_ERROR_WANT_READ:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_read(timeout=self.timeout, timeout_exc=_SSLErrorHandshakeTimeout)
                 elif ex.args[0] == SSL_ERROR_WANT_WRITE:
                     if self.timeout == 0.0:
                         raise
-                    six.exc_clear()
+                    _exc_clear()
                     self._io.wait_write(timeout=self.timeout, timeout_exc=_SSLErrorHandshakeTimeout)
                 else:
                     raise
@@ -2,19 +2,107 @@
 # This file is part of Evergreen. See the NOTICE for more information.
 #
 
+from collections import deque
+
 import evergreen
 from evergreen.timeout import Timeout
 
-__all__ = ['Semaphore', 'BoundedSemaphore', 'Lock', 'RLock', 'Condition', 'Barrier']
+__all__ = ['WaitQueue', 'Semaphore', 'BoundedSemaphore', 'Lock', 'RLock', 'Condition', 'Barrier']
+
+
+class _Waiter(object):
+    __slots__ = ('task', 'handler', 'value')
+
+    def __init__(self, task):
+        self.task = task
+        self.handler = None
+        self.value = None
+
+
+class WaitQueue(object):
+    """FIFO queue of tasks waiting to be woken up. Adding and removing a task are O(1):
+    tasks which stop waiting before being woken up are only marked as gone and skipped
+    when they reach the front of the queue.
+    """
+
+    def __init__(self, unclaimed_cb=None, pass_on=True):
+        self._waiters = deque()
+        self._count = 0
+        self._unclaimed_cb = unclaimed_cb
+        self._pass_on = pass_on
+
+    def __len__(self):
+        return self._count
+
+    def wait(self, timeout=None, front=False):
+        waiter = _Waiter(evergreen.current.task)
+        if front:
+            self._waiters.appendleft(waiter)
+        else:
+            self._waiters.append(waiter)
+        self._count += 1
+        if timeout is not None:
+            timer = Timeout(timeout)
+            timer.start()
+        else:
+            timer = None
+        try:
+            evergreen.current.loop.switch()
+        except BaseException as e:
+            if waiter.handler is None:
+                # Still queued, it will be skipped by notify
+                waiter.task = None
+                self._count -= 1
+                self._maybe_compact()
+                if e is timer:
+                    return False
+                raise
+            # Woken up but didn't get to run, don't lose the notification
+            waiter.handler.cancel()
+            if e is timer:
+                return waiter.value
+            if self._pass_on and not self.notify(1, waiter.value) and self._unclaimed_cb is not None:
+                self._unclaimed_cb(waiter.value)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return waiter.value
+
+    def notify(self, n=1, value=True):
+        waiters = self._waiters
+        loop = evergreen.current.loop
+        woken = 0
+        while woken < n and waiters:
+            waiter = waiters.popleft()
+            if waiter.task is None:
+                continue
+            waiter.value = value
+            waiter.handler = loop.call_soon(waiter.task.switch)
+            woken += 1
+        self._count -= woken
+        return woken
+
+    def notify_all(self, value=True):
+        return self.notify(self._count, value)
+
+    def _maybe_compact(self):
+        if len(self._waiters) > 2 * self._count + 32:
+            self._waiters = deque(waiter for waiter in self._waiters if waiter.task is not None)
+
+
+# Notification value used to transfer ownership of a Semaphore in handoff mode
+_HANDOFF = object()
 
 
 class Semaphore(object):
 
-    def __init__(self, value=1):
+    def __init__(self, value=1, handoff=False):
         if value < 0:
             raise ValueError("Semaphore must be initialized with a positive number, got %s" % value)
         self._counter = value
-        self._waiters = set()
+        self._handoff = handoff
+        self._waiters = WaitQueue(self._unclaimed)
 
     def acquire(self, blocking=True, timeout=None):
         if self._counter > 0:
@@ -22,35 +110,36 @@ class Semaphore(object):
             return True
         elif not blocking:
             return False
-        else:
-            current = evergreen.current.task
-            self._waiters.add(current)
-            timer = Timeout(timeout)
-            timer.start()
-            loop = evergreen.current.loop
-            try:
-                while self._counter <= 0:
-                    loop.switch()
-            except Timeout as e:
-                if e is timer:
-                    return False
-                raise
-            else:
-                self._counter -= 1
-                return True
-            finally:
-                timer.cancel()
-                self._waiters.discard(current)
+        timer = Timeout(timeout)
+        timer.start()
+        try:
+            value = self._waiters.wait()
+            while value is not _HANDOFF:
+                if self._counter > 0:
+                    self._counter -= 1
+                    return True
+                # Some other task took the semaphore before we could run, keep our place
+                value = self._waiters.wait(front=True)
+            return True
+        except Timeout as e:
+            if e is timer:
+                return False
+            raise
+        finally:
+            timer.cancel()
 
     def release(self):
-        self._counter += 1
-        if self._waiters:
-            evergreen.current.loop.call_soon(self._notify_waiters)
+        if self._handoff and self._waiters:
+            # Transfer ownership straight to the next waiter, the counter is left untouched
+            self._waiters.notify(1, _HANDOFF)
+        else:
+            self._counter += 1
+            self._waiters.notify(1)
 
-    def _notify_waiters(self):
-        if self._waiters and self._counter > 0:
-            waiter = self._waiters.pop()
-            waiter.switch()
+    def _unclaimed(self, value):
+        # A woken up waiter went away and there was nobody else to pass the wakeup to
+        if value is _HANDOFF:
+            self._counter += 1
 
     def __enter__(self):
         self.acquire()
@@ -61,8 +150,8 @@ class Semaphore(object):
 
 class BoundedSemaphore(Semaphore):
 
-    def __init__(self, value=1):
-        super(BoundedSemaphore, self).__init__(value)
+    def __init__(self, value=1, handoff=False):
+        super(BoundedSemaphore, self).__init__(value, handoff)
         self._initial_counter = value
 
     def release(self):
@@ -73,8 +162,8 @@ class BoundedSemaphore(Semaphore):
 
 class Lock(Semaphore):
 
-    def __init__(self):
-        super(Lock, self).__init__(value=1)
+    def __init__(self, handoff=False):
+        super(Lock, self).__init__(value=1, handoff=handoff)
 
 
 class RLock(object):
@@ -132,7 +221,7 @@ class Condition(object):
         if lock is None:
             lock = RLock()
         self._lock = lock
-        self._waiters = []
+        self._waiters = WaitQueue()
 
         # Export the lock's acquire() and release() methods
         self.acquire = lock.acquire
@@ -156,12 +245,10 @@ class Condition(object):
     def wait(self, timeout=None):
         if not self._is_owned():
             raise RuntimeError('cannot wait on un-acquired lock')
-        waiter = Semaphore()
-        waiter.acquire()
-        self._waiters.append(waiter)
+        # Releasing the lock doesn't yield, so no notification can be missed
         saved_state = self._release_save()
         try:
-            return waiter.acquire(timeout=timeout)
+            return self._waiters.wait(timeout)
         finally:
             self._acquire_restore(saved_state)
 
@@ -177,14 +264,7 @@ class Condition(object):
     def notify(self, n=1):
         if not self._is_owned():
             raise RuntimeError('cannot wait on un-acquired lock')
-        _waiters = self._waiters
-        waiters = _waiters[:n]
-        for waiter in waiters:
-            waiter.release()
-            try:
-                _waiters.remove(waiter)
-            except ValueError:
-                pass
+        self._waiters.notify(n)
 
     def notify_all(self):
         self.notify(len(self._waiters))
@@ -1,5 +1,5 @@
 
-from common import unittest, EvergreenTestCase
+from common import dummy, unittest, EvergreenTestCase
 
 import evergreen
 from evergreen.event import Event
@@ -15,6 +15,18 @@ class EventTests(EvergreenTestCase):
         evergreen.spawn(ev.set)
         self.loop.run()
 
+    def test_event_many_waiters(self):
+        ev = Event()
+        woken = []
+        def waiter(x):
+            self.assertTrue(ev.wait())
+            woken.append(x)
+        for x in range(1000):
+            evergreen.spawn(waiter, x)
+        self.loop.call_later(0.01, ev.set)
+        self.loop.run()
+        self.assertEqual(woken, list(range(1000)))
+
     def test_event_timeout(self):
         ev = Event()
         def waiter():
@@ -43,6 +55,21 @@ class EventTests(EvergreenTestCase):
         self.loop.run()
         self.assertFalse(ev.is_set())
 
+    def test_event_kill_woken_waiter(self):
+        ev = Event()
+        d = dummy()
+        def runner():
+            t1 = evergreen.spawn(ev.wait)
+            evergreen.sleep(0.01)
+            # t1 is killed after being woken up, but before it gets to run
+            t1.kill()
+            ev.set()
+            ev.clear()
+            d.value = ev.wait(0.05)
+        evergreen.spawn(runner)
+        self.loop.run()
+        self.assertFalse(d.value)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
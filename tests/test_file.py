@@ -0,0 +1,122 @@
+
+from common import dummy, unittest, EvergreenTestCase
+
+import os
+import shutil
+import socket
+import tempfile
+
+import evergreen
+from evergreen.io import file
+
+
+class FileTests(EvergreenTestCase):
+
+    def setUp(self):
+        super(FileTests, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.dat')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(FileTests, self).tearDown()
+
+    def test_functions(self):
+        def func():
+            fd = file.open(self.path, os.O_RDWR | os.O_CREAT)
+            self.assertEqual(file.write(fd, b'hello world'), 11)
+            self.assertEqual(file.pread(fd, 5, 6), b'world')
+            self.assertEqual(file.pwrite(fd, b'W', 6), 1)
+            file.fsync(fd)
+            self.assertEqual(file.fstat(fd).st_size, 11)
+            self.assertEqual(file.stat(self.path).st_size, 11)
+            a, b = socket.socketpair()
+            self.assertEqual(file.sendfile(a.fileno(), fd, 2, 7), 7)
+            self.assertEqual(b.recv(100), b'llo Wor')
+            a.close()
+            b.close()
+            file.close(fd)
+            self.assertRaises(file.FSError, file.read, fd, 1)
+            self.assertRaises(file.FSError, file.close, fd)
+            self.assertRaises(file.FSError, file.stat, os.path.join(self.dir, 'missing'))
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_file(self):
+        def func():
+            with file.File(self.path, 'w', buffer_size=4) as f:
+                f.write(b'01')
+                self.assertEqual(os.path.getsize(self.path), 0)
+                f.write(bytearray(b'2345'))
+                f.write(b'6789')
+                self.assertEqual(f.tell(), 10)
+            self.assertTrue(f.closed)
+            self.assertRaises(ValueError, f.write, b'x')
+            with file.File(self.path, 'r+b', buffer_size=4) as f:
+                self.assertEqual(f.read(3), b'012')
+                self.assertEqual(f.read(2), b'34')
+                f.write(b'xx')
+                self.assertEqual(f.read(), b'789')
+                self.assertEqual(f.seek(-4, os.SEEK_END), 6)
+                self.assertEqual(f.read(2), b'67')
+                f.seek(0)
+                self.assertEqual(f.read(100), b'01234xx789')
+                self.assertEqual(f.stat().st_size, 10)
+            with file.File(self.path, 'a') as f:
+                self.assertEqual(f.tell(), 10)
+                f.write(b'!')
+                f.flush()
+                self.assertEqual(f.tell(), 11)
+                self.assertRaises(IOError, f.read)
+            with file.File(self.path) as f:
+                self.assertEqual(f.read(), b'01234xx789!')
+                self.assertRaises(IOError, f.write, b'x')
+            self.assertRaises(ValueError, file.File, self.path, 'rt')
+            self.assertRaises(ValueError, file.File, self.path, 'rw')
+            self.assertRaises(file.FSError, file.File, self.path, 'x')
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_iter_chunks(self):
+        payload = os.urandom(100000)
+        with open(self.path, 'wb') as f:
+            f.write(payload)
+        d = dummy()
+        def func():
+            with file.File(self.path) as f:
+                f.seek(10)
+                d.chunks = list(f.iter_chunks(30000))
+                self.assertEqual(f.tell(), len(payload))
+        evergreen.spawn(func)
+        self.loop.run()
+        self.assertEqual([len(x) for x in d.chunks], [30000, 30000, 30000, 9990])
+        self.assertEqual(b''.join(d.chunks), payload[10:])
+
+    def test_max_concurrency(self):
+        d = dummy()
+        d.callbacks = []
+        d.submitted = []
+        def fake_op(loop, callback):
+            d.callbacks.append(callback)
+        def func():
+            file._fs_call(fake_op)
+        def complete():
+            for x in range(3):
+                evergreen.sleep(0.01)
+                d.submitted.append(len(d.callbacks))
+                callbacks, d.callbacks = d.callbacks, []
+                for cb in callbacks:
+                    cb(self.loop._loop, None, None)
+        def start():
+            self.assertRaises(ValueError, file.set_max_concurrency, 0)
+            file.set_max_concurrency(2)
+            for x in range(5):
+                evergreen.spawn(func)
+            evergreen.spawn(complete)
+        evergreen.spawn(start)
+        self.loop.run()
+        self.assertEqual(d.submitted, [2, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
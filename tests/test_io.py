@@ -1,12 +1,17 @@
 
 from common import dummy, unittest, EvergreenTestCase
 
+import os
 import re
+import socket
+import struct
 import sys
 
 import evergreen
-from evergreen.io import tcp, pipe, udp
+from evergreen.io import errno, tcp, pipe, udp
 from evergreen.io.util import StringBuffer
+from evergreen.lib import socket as green_socket
+from evergreen.timeout import Timeout
 
 
 if sys.platform == 'win32':
@@ -75,6 +80,84 @@ class BufferTest(unittest.TestCase):
         data = buf.read_until_regex(regex)
         self.assertEqual(data, None)
 
+    def test_read_until_split_delimiter(self):
+        buf = StringBuffer()
+        buf.feed(b'hello\r')
+        self.assertEqual(buf.read_until(b'\r\n'), None)
+        buf.feed(b'\nworld')
+        self.assertEqual(buf.read_until(b'\r\n'), b'hello\r\n')
+        self.assertEqual(buf.read_until(b'\r\n'), None)
+        self.assertEqual(buf.read_until(b'd'), b'world')
+        self.assertEqual(buf.size, 0)
+
+    def test_read_until_many_delimiters(self):
+        buf = StringBuffer()
+        buf.feed(b'GET / HTTP/1.1\r\nHost: x')
+        self.assertEqual(buf.read_until(b'\r\n\r\n'), None)
+        self.assertEqual(buf.read_until(b'\r\n'), b'GET / HTTP/1.1\r\n')
+        self.assertEqual(buf.read_until(b'\r\n'), None)
+        buf.feed(b'\r\n\r\n')
+        self.assertEqual(buf.read_until(b'\r\n\r\n'), b'Host: x\r\n\r\n')
+
+    def test_read_until_max_bytes(self):
+        buf = StringBuffer()
+        buf.feed(b'hello')
+        self.assertEqual(buf.read_until(b'\n', max_bytes=10), None)
+        buf.feed(b' world\n')
+        self.assertRaises(IOError, buf.read_until, b'\n', max_bytes=10)
+        self.assertEqual(buf.read_until(b'\n', max_bytes=12), b'hello world\n')
+        buf.feed(b'x' * 10)
+        self.assertRaises(IOError, buf.read_until, b'\n', max_bytes=10)
+        self.assertRaises(IOError, buf.read_until_regex, re.compile(b'\n'), max_bytes=10)
+
+    def test_read_into(self):
+        buf = StringBuffer()
+        buf.feed(b'hello world')
+        data = bytearray(5)
+        self.assertEqual(buf.read_into(data), 5)
+        self.assertEqual(data, b'hello')
+        data = bytearray(100)
+        self.assertEqual(buf.read_into(data), 6)
+        self.assertEqual(data[:6], b' world')
+        self.assertEqual(buf.read_into(data), 0)
+
+    def test_peek(self):
+        buf = StringBuffer()
+        buf.feed(b'hello world')
+        self.assertEqual(buf.peek(5).tobytes(), b'hello')
+        self.assertEqual(buf.peek().tobytes(), b'hello world')
+        self.assertEqual(buf.read(6), b'hello ')
+        self.assertEqual(buf.peek(100).tobytes(), b'world')
+
+    def test_compact(self):
+        buf = StringBuffer()
+        chunk = b'x' * 1000 + b'\n'
+        for i in range(200):
+            buf.feed(chunk)
+            self.assertEqual(buf.read_until(b'\n'), chunk)
+        buf.feed(chunk * 3)
+        self.assertEqual(buf.read(len(chunk) * 2), chunk * 2)
+        self.assertEqual(buf.size, len(chunk))
+        self.assertEqual(buf.read_until(b'\n'), chunk)
+
+    def test_read_frame(self):
+        header = struct.Struct('!H')
+        buf = StringBuffer()
+        buf.feed(b'\x00\x05hel')
+        self.assertEqual(buf.read_frame(header), None)
+        buf.feed(b'lo\x00\x00')
+        self.assertEqual(buf.read_frame(header), b'hello')
+        self.assertEqual(buf.read_frame(header), b'')
+        self.assertEqual(buf.read_frame(header), None)
+        buf.feed(b'\x01\x00')
+        self.assertRaises(IOError, buf.read_frame, header, max_size=255)
+
+    def test_read_frame_negative_length(self):
+        header = struct.Struct('!i')
+        buf = StringBuffer()
+        buf.feed(header.pack(-4) + b'data')
+        self.assertRaises(IOError, buf.read_frame, header)
+
     def test_clear(self):
         buf = StringBuffer()
         buf.feed(b'hello world')
@@ -125,6 +208,384 @@ class IOTests(EvergreenTestCase):
         evergreen.spawn(connect)
         self.loop.run()
 
+    def test_tcp_read_timeout(self):
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            with Timeout(0.01, False):
+                client.read_until(b'\n')
+            client.write(b'PING\n')
+            data = client.read_until(b'\n')
+            self.assertEqual(data, b'PING\n')
+            client.close()
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_read_until_max_bytes(self):
+        class Server(tcp.TCPServer):
+            @evergreen.task
+            def handle_connection(self_, connection):
+                self.assertRaises(tcp.TCPError, connection.read_until, b'\n', max_bytes=1024)
+                self.assertTrue(connection.closed)
+                self.server.close()
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.write(b'x' * 8192)
+            client.read_until(b'\n')
+            self.assertTrue(client.closed)
+        def start_server():
+            self.server = Server()
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_writelines(self):
+        def connect():
+            client = tcp.TCPClient()
+            client.writelines([b'PI', b'NG', b'\n'])
+            client.connect(TEST_CLIENT)
+            self.assertEqual(client.read_until(b'\n'), b'PING\n')
+            client.writelines(iter([b'PO', b'NG', b'\n']))
+            self.assertEqual(client.read_until(b'\n'), b'PONG\n')
+            client.close()
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_write_coalescing(self):
+        class Server(tcp.TCPServer):
+            @evergreen.task
+            def handle_connection(self_, connection):
+                connection.set_write_coalescing(True)
+                self.assertFalse(connection.write(b'hello '))
+                self.assertFalse(connection.writelines([b'world', b'\n']))
+                self.assertFalse(connection.write(b'bye\n'))
+                connection.close()
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.set_write_coalescing(True)
+            client.write(b'x')
+            client.flush()
+            self.assertEqual(client.read_until(b'\n'), b'hello world\n')
+            self.assertEqual(client.read_until(b'\n'), b'bye\n')
+            client.close()
+            self.server.close()
+        def start_server():
+            self.server = Server()
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_drain(self):
+        chunk = b'x' * (64*1024)
+        count = 64
+        d = dummy()
+        d.max_buffered = 0
+        class Server(tcp.TCPServer):
+            @evergreen.task
+            def handle_connection(self_, connection):
+                for x in range(count):
+                    evergreen.sleep(0.001)
+                    self.assertEqual(connection.read_bytes(len(chunk)), chunk)
+                self.server.close()
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.set_write_watermarks(high=128*1024)
+            for x in range(count):
+                client.write(chunk)
+                d.max_buffered = max(d.max_buffered, client.write_buffer_size)
+                client.drain()
+                self.assertTrue(client.write_buffer_size <= 128*1024)
+            client.flush()
+            self.assertEqual(client.write_buffer_size, 0)
+        def start_server():
+            self.server = Server()
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+        self.assertTrue(d.max_buffered <= 128*1024 + len(chunk))
+
+    def test_write_watermarks_invalid(self):
+        client = tcp.TCPClient()
+        self.assertRaises(ValueError, client.set_write_watermarks, 10, 20)
+        self.assertRaises(ValueError, client.set_write_watermarks, low=-1)
+        endpoint = udp.UDPEndpoint()
+        self.assertRaises(ValueError, endpoint.set_write_watermarks, 10, 20)
+        client.close()
+        endpoint.close()
+
+    def test_tcp_read_into(self):
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.write(b'PING\n')
+            buf = bytearray(100)
+            n = client.read_into(buf)
+            self.assertEqual(buf[:n], b'PING\n'[:n])
+            client.write(b'hello ')
+            client.write(b'world\n')
+            buf = bytearray(len(b'PING\nhello world\n') - n)
+            self.assertEqual(client.read_exactly_into(memoryview(buf)), len(buf))
+            self.assertEqual(buf, b'PING\nhello world\n'[n:])
+            client.close()
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_frames(self):
+        class Server(tcp.TCPServer):
+            @evergreen.task
+            def handle_connection(self_, connection):
+                while True:
+                    frames = connection.read_frames(10)
+                    if not frames:
+                        break
+                    for frame in frames:
+                        connection.write_frame(frame)
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.write(b''.join(struct.pack('!I', len(x)) + x for x in (b'a', b'', b'ccc')))
+            self.assertEqual(client.read_frame(), b'a')
+            self.assertEqual(client.read_frames(10), [b'', b'ccc'])
+            client.write_frame(b'x' * 100000)
+            self.assertEqual(client.read_frame(), b'x' * 100000)
+            client.close()
+            self.server.close()
+        def start_server():
+            self.server = Server()
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_frame_format(self):
+        client = tcp.TCPClient()
+        client.set_frame_format('<Q')
+        for header in ('!f', '!ii', '2H', '!s'):
+            self.assertRaises(ValueError, client.set_frame_format, header)
+        # the length must fit in the header
+        client.set_frame_format('!H', max_size=128*1024)
+        self.assertRaises(ValueError, client.write_frame, b'x' * 65536)
+        client.set_frame_format('!b')
+        self.assertRaises(ValueError, client.write_frame, b'x' * 128)
+        client.close()
+
+    def test_tcp_frame_too_large(self):
+        class Server(tcp.TCPServer):
+            @evergreen.task
+            def handle_connection(self_, connection):
+                connection.set_frame_format('!H', max_size=1024)
+                self.assertRaises(tcp.TCPError, connection.read_frame)
+                self.assertTrue(connection.closed)
+                self.server.close()
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.set_frame_format('!H', max_size=4096)
+            client.write_frame(b'x' * 2048)
+            self.assertRaises(ValueError, client.write_frame, b'x' * 8192)
+            self.assertEqual(client.read_frame(), None)
+        def start_server():
+            self.server = Server()
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def _test_multi_tcp_server(self, **kw):
+        d = dummy()
+        d.counts = []
+        class Server(EchoMixin, tcp.MultiTCPServer):
+            pass
+        def connect():
+            clients = []
+            for x in range(8):
+                client = tcp.TCPClient()
+                client.connect(TEST_CLIENT)
+                client.write(b'PING\n')
+                self.assertEqual(client.read_until(b'\n'), b'PING\n')
+                clients.append(client)
+            d.counts.append(self.server.connection_count)
+            for client in clients:
+                client.close()
+            for x in range(100):
+                if self.server.connection_count == 0:
+                    break
+                evergreen.sleep(0.01)
+            d.counts.append(self.server.connection_count)
+            self.server.close()
+        def start_server():
+            self.server = Server(**kw)
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+            d.counts.append(self.server.connection_count)
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+        self.assertEqual(d.counts, [8, 0, 0])
+
+    def test_multi_tcp_server_threads(self):
+        self._test_multi_tcp_server(workers=3)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'fork is not available')
+    def test_multi_tcp_server_processes(self):
+        self._test_multi_tcp_server(workers=3, processes=True)
+
+    @unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'SO_REUSEPORT is not available')
+    def test_multi_tcp_server_reuse_port(self):
+        self._test_multi_tcp_server(workers=3, reuse_port=True)
+
+    def test_tcp_max_connections(self):
+        stats = {'peak': 0, 'served': 0}
+        class Server(EchoMixin, tcp.TCPServer):
+            def handle_connection(self_, connection):
+                stats['peak'] = max(stats['peak'], len(self_.connections))
+                super(Server, self_).handle_connection(connection)
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.write(b'PING\n')
+            self.assertEqual(client.read_until(b'\n'), b'PING\n')
+            evergreen.sleep(0.05)
+            client.close()
+            stats['served'] += 1
+            if stats['served'] == 5:
+                self.server.close()
+        def start_server():
+            self.server = Server(max_connections=2)
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        for x in range(5):
+            evergreen.spawn(connect)
+        self.loop.run()
+        self.assertEqual(stats['peak'], 2)
+        self.assertEqual(stats['served'], 5)
+        self.assertRaises(ValueError, tcp.TCPServer, max_connections=0)
+
+    def test_tcp_connection_pool(self):
+        def ping(conn):
+            conn.write(b'PING\n')
+            self.assertEqual(conn.read_until(b'\n'), b'PING\n')
+        def connect():
+            pool = tcp.TCPConnectionPool(max_size=2, keepalive=10)
+            with pool.connection(TEST_CLIENT) as conn1:
+                ping(conn1)
+            with pool.connection(TEST_CLIENT) as conn2:
+                ping(conn2)
+            self.assertIs(conn1, conn2)
+            try:
+                with pool.connection(TEST_CLIENT) as conn3:
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.assertIs(conn1, conn3)
+            self.assertTrue(conn3.closed)
+            stats = pool.stats
+            self.assertEqual((stats['hits'], stats['misses'], stats['discarded']), (2, 1, 1))
+            self.assertEqual(stats['hit_rate'], 2.0 / 3)
+            # the server closes the idle connection, it's not handed out again
+            conn4 = pool.get(TEST_CLIENT)
+            pool.put(conn4)
+            for conn in list(self.server.connections):
+                conn.close()
+            evergreen.sleep(0.01)
+            conn5 = pool.get(TEST_CLIENT)
+            self.assertIsNot(conn4, conn5)
+            ping(conn5)
+            pool.put(conn5)
+            self.assertRaises(ValueError, pool.put, conn5)
+            pool.close()
+            self.assertTrue(conn5.closed)
+            self.assertRaises(tcp.TCPError, pool.get, TEST_CLIENT)
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_tcp_connection_pool_max_size(self):
+        pool = tcp.TCPConnectionPool(max_size=1, idle_timeout=0.05)
+        clients = []
+        def use(delay):
+            with pool.connection(TEST_CLIENT) as conn:
+                clients.append(conn)
+                evergreen.sleep(delay)
+        def connect():
+            t1 = evergreen.spawn(use, 0.05)
+            t2 = evergreen.spawn(use, 0)
+            evergreen.sleep(0.01)
+            self.assertRaises(tcp.TCPError, pool.get, TEST_CLIENT, timeout=0.01)
+            t1.join()
+            t2.join()
+            self.assertIs(clients[0], clients[1])
+            stats = pool.stats
+            self.assertEqual(stats['waits'], 2)
+            self.assertTrue(stats['wait_time'] > 0)
+            self.assertEqual(stats['idle'], 1)
+            # idle connections are closed after idle_timeout
+            evergreen.sleep(0.1)
+            self.assertEqual(pool.stats['idle'], 0)
+            self.assertTrue(clients[0].closed)
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def _fake_host(self, name):
+        # Make *name* resolve to an unreachable address, a closed port and the test
+        # server, in that order
+        infos = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.1', TEST_PORT)),
+                 (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', TEST_PORT + 1)),
+                 (socket.AF_INET, socket.SOCK_STREAM, 6, '', TEST_CLIENT)]
+        key = (socket.getaddrinfo, (name, TEST_PORT, 0, socket.SOCK_STREAM, 0, 0))
+        self.loop.resolver._cache.set(key, infos, None, self.loop.time() + 60)
+
+    def test_tcp_happy_eyeballs(self):
+        self._fake_host('evergreen.test')
+        def connect():
+            client = tcp.TCPClient()
+            t0 = self.loop.time()
+            client.connect(('evergreen.test', TEST_PORT), happy_eyeballs_delay=0.05)
+            self.assertTrue(self.loop.time() - t0 < 1)
+            self.assertEqual(client.peername, TEST_CLIENT)
+            client.write(b'PING\n')
+            self.assertEqual(client.read_until(b'\n'), b'PING\n')
+            client.close()
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_create_connection_happy_eyeballs(self):
+        self._fake_host('evergreen.test')
+        def connect():
+            t0 = self.loop.time()
+            sock = green_socket.create_connection(('evergreen.test', TEST_PORT), happy_eyeballs_delay=0.05)
+            self.assertTrue(self.loop.time() - t0 < 1)
+            self.assertEqual(sock.getpeername(), TEST_CLIENT)
+            sock.close()
+            self.assertRaises(socket.error, green_socket.create_connection, ('127.0.0.1', TEST_PORT + 1), happy_eyeballs_delay=0.05)
+            self.server.close()
+        evergreen.spawn(self._start_tcp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
     def test_tcp_shutdown(self):
         def connect():
             client = tcp.TCPClient()
@@ -139,6 +600,41 @@ class IOTests(EvergreenTestCase):
         evergreen.spawn(connect)
         self.loop.run()
 
+    def test_tcp_continuous_read(self):
+        payload = b'x' * (1024*1024)
+        d = dummy()
+        d.max_buffered = 0
+        class Server(tcp.TCPServer):
+            @evergreen.task
+            def handle_connection(self, connection):
+                connection.write(payload)
+                connection.flush()
+                connection.close()
+        def connect():
+            client = tcp.TCPClient()
+            client.connect(TEST_CLIENT)
+            client.set_continuous_read(True, high_water=64*1024)
+            received = []
+            while True:
+                evergreen.sleep(0)
+                d.max_buffered = max(d.max_buffered, client._read_buffer.size)
+                data = client.read_bytes(16*1024)
+                if not data:
+                    break
+                received.append(data)
+            self.assertEqual(b''.join(received), payload)
+            self.assertTrue(client.closed)
+            self.server.close()
+        def start_server():
+            self.server = Server()
+            self.server.bind(TEST_SERVER)
+            self.server.serve()
+        evergreen.spawn(start_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+        # reading is paused at the high water mark, plus at most one chunk
+        self.assertTrue(0 < d.max_buffered < 64*1024 + 65536)
+
     def _start_pipe_echo_server(self):
         self.server = EchoPipeServer()
         self.server.bind(TEST_PIPE)
@@ -196,6 +692,179 @@ class IOTests(EvergreenTestCase):
         self.loop.run()
 
 
+    def test_udp_drain(self):
+        def connect():
+            client = udp.UDPEndpoint()
+            client.set_write_watermarks(high=4096, low=0)
+            for x in range(100):
+                client.send(b'x' * 1024, TEST_UDP_ENDPOINT)
+                client.drain()
+                self.assertTrue(client.write_buffer_size <= 4096)
+            client.flush()
+            self.assertEqual(client.write_buffer_size, 0)
+            client.close()
+            self.server.close()
+        evergreen.spawn(self._start_udp_echo_server)
+        evergreen.spawn(connect)
+        self.loop.run()
+
+    def test_udp_receive_many(self):
+        def func():
+            server = udp.UDPEndpoint()
+            server.bind(TEST_UDP_ENDPOINT)
+            client = udp.UDPEndpoint()
+            self.assertEqual(server.receive_many(10, timeout=0.01), [])
+            client.send_many([(str(x).encode('ascii'), TEST_UDP_ENDPOINT) for x in range(5)])
+            self.assertEqual(client.write_buffer_size, 5)
+            client.flush()
+            self.assertEqual(client.write_buffer_size, 0)
+            evergreen.sleep(0.01)
+            data = server.receive_many(3)
+            self.assertEqual([x[0] for x in data], [b'0', b'1', b'2'])
+            self.assertEqual(server.receive(), (b'3', client.sockname))
+            self.assertEqual(server.receive_many(10), [(b'4', client.sockname)])
+            client.close()
+            server.close()
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_udp_continuous_receive(self):
+        def func():
+            server = udp.UDPEndpoint()
+            server.bind(TEST_UDP_ENDPOINT)
+            server.set_continuous_receive(True, queue_size=4)
+            client = udp.UDPEndpoint()
+            for x in range(6):
+                client.send(str(x).encode('ascii'), TEST_UDP_ENDPOINT)
+            client.flush()
+            evergreen.sleep(0.01)
+            self.assertEqual(server.dropped, 2)
+            data = server.receive_many(10)
+            self.assertEqual([x[0] for x in data], [b'0', b'1', b'2', b'3'])
+            client.send(b'x', TEST_UDP_ENDPOINT)
+            self.assertEqual(server.receive()[0], b'x')
+            client.close()
+            server.close()
+            self.assertRaises(udp.UDPError, server.receive_many, 10)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_udp_continuous_receive_error(self):
+        d = dummy()
+        server = udp.UDPEndpoint()
+        server.bind(TEST_UDP_ENDPOINT)
+        server.set_continuous_receive(True)
+        # there is no simple way to make a UDP receive fail, call the callback directly
+        receive_cb = server._UDPEndpoint__queue_receive_cb
+        def receiver():
+            self.assertRaises(udp.UDPError, server.receive)
+            # datagrams received before the error are handed out first
+            server.set_continuous_receive(True)
+            self.assertEqual(server.receive_many(10), [(b'x', None)])
+            self.assertRaises(udp.UDPError, server.receive_many, 10)
+            d.done = True
+        def fail():
+            receive_cb(None, None, 0, None, errno.ECONNREFUSED)
+            evergreen.sleep(0.01)
+            receive_cb(None, None, 0, b'x', None)
+            receive_cb(None, None, 0, None, errno.ECONNREFUSED)
+        evergreen.spawn(receiver)
+        evergreen.spawn(fail)
+        self.loop.run()
+        server.close()
+        self.assertTrue(d.done)
+
+    def test_udp_continuous_receive_consumers(self):
+        d = dummy()
+        d.received = []
+        server = udp.UDPEndpoint()
+        server.bind(TEST_UDP_ENDPOINT)
+        server.set_continuous_receive(True)
+        def consumer():
+            d.received.append(server.receive()[0])
+        def producer():
+            client = udp.UDPEndpoint()
+            client.send_many([(b'a', TEST_UDP_ENDPOINT), (b'b', TEST_UDP_ENDPOINT)])
+            client.flush()
+            evergreen.sleep(0.05)
+            client.close()
+            server.close()
+        evergreen.spawn(consumer)
+        evergreen.spawn(consumer)
+        evergreen.spawn(producer)
+        self.loop.run()
+        self.assertEqual(sorted(d.received), [b'a', b'b'])
+
+    def test_udp_close_while_receiving(self):
+        server = udp.UDPEndpoint()
+        server.bind(TEST_UDP_ENDPOINT)
+        server.set_continuous_receive(True)
+        def receiver():
+            self.assertRaises(udp.UDPError, server.receive_many, 10)
+        evergreen.spawn(receiver)
+        evergreen.spawn(server.close)
+        self.loop.run()
+
+    def test_udp_multicast(self):
+        def func():
+            receivers = []
+            port = 0
+            for x in range(2):
+                # endpoints are bound with SO_REUSEADDR, so they can share the port
+                endpoint = udp.UDPEndpoint()
+                endpoint.bind(('0.0.0.0', port))
+                endpoint.join_group('239.255.0.1', '127.0.0.1')
+                port = endpoint.sockname[1]
+                receivers.append(endpoint)
+            client = udp.UDPEndpoint()
+            client.bind(('127.0.0.1', 0))
+            client.set_multicast_loop(True)
+            client.set_multicast_ttl(1)
+            # a single datagram reaches all the members of the group
+            client.send(b'PING', ('239.255.0.1', port))
+            client.flush()
+            for endpoint in receivers:
+                self.assertEqual(endpoint.receive_many(1, timeout=1), [(b'PING', client.sockname)])
+            receivers[0].leave_group('239.255.0.1', '127.0.0.1')
+            self.assertRaises(udp.UDPError, receivers[0].leave_group, '239.255.0.1', '127.0.0.1')
+            for endpoint in receivers:
+                endpoint.close()
+            client.close()
+            self.assertRaises(udp.UDPError, client.set_multicast_ttl, 1)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_udp_multicast_default_interface(self):
+        d = dummy()
+        def func():
+            endpoint = udp.UDPEndpoint()
+            endpoint.bind(('0.0.0.0', 0))
+            # the system picks the interface
+            endpoint.join_group('239.255.0.2')
+            endpoint.leave_group('239.255.0.2')
+            self.assertRaises(udp.UDPError, endpoint.leave_group, '239.255.0.2')
+            endpoint.close()
+            d.done = True
+        evergreen.spawn(func)
+        self.loop.run()
+        self.assertTrue(d.done)
+
+    def test_udp_broadcast(self):
+        def func():
+            server = udp.UDPEndpoint()
+            server.bind(('0.0.0.0', 0))
+            client = udp.UDPEndpoint()
+            client.bind(('127.0.0.1', 0))
+            client.set_ttl(1)
+            client.set_broadcast(True)
+            client.send(b'PING', ('127.255.255.255', server.sockname[1]))
+            client.flush()
+            self.assertEqual(server.receive_many(1, timeout=1), [(b'PING', client.sockname)])
+            server.close()
+            client.close()
+        evergreen.spawn(func)
+        self.loop.run()
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
 
@@ -3,6 +3,8 @@ from common import dummy, unittest, EvergreenTestCase
 
 import evergreen
 from evergreen import locks
+from evergreen.core.utils import Result
+from evergreen.timeout import Timeout
 
 
 class LocksTests(EvergreenTestCase):
@@ -15,6 +17,72 @@ class LocksTests(EvergreenTestCase):
         evergreen.spawn(func)
         self.loop.run()
 
+    def test_semaphore_fifo(self):
+        d = dummy()
+        d.order = []
+        lock = locks.Semaphore()
+        def func(x):
+            with lock:
+                d.order.append(x)
+                evergreen.sleep(0)
+        def runner():
+            lock.acquire()
+            for x in range(5):
+                evergreen.spawn(func, x)
+            evergreen.sleep(0.01)
+            lock.release()
+        evergreen.spawn(runner)
+        self.loop.run()
+        self.assertEqual(d.order, list(range(5)))
+
+    def test_semaphore_handoff(self):
+        d = dummy()
+        d.order = []
+        lock = locks.Lock(handoff=True)
+        def waiter():
+            with lock:
+                d.order.append('waiter')
+        def runner():
+            lock.acquire()
+            evergreen.spawn(waiter)
+            evergreen.sleep(0.01)
+            lock.release()
+            # The lock was handed off to the waiter, which didn't run yet
+            self.assertFalse(lock.acquire(blocking=False))
+            with lock:
+                d.order.append('runner')
+        evergreen.spawn(runner)
+        self.loop.run()
+        self.assertEqual(d.order, ['waiter', 'runner'])
+
+    def test_semaphore_timeout(self):
+        lock = locks.Semaphore(0)
+        def func():
+            self.assertFalse(lock.acquire(timeout=0.01))
+            self.assertEqual(len(lock._waiters), 0)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_semaphore_handoff_kill(self):
+        d = dummy()
+        d.acquired = False
+        lock = locks.Lock(handoff=True)
+        def waiter1():
+            lock.acquire()
+        def waiter2():
+            d.acquired = lock.acquire(timeout=1)
+        def runner():
+            lock.acquire()
+            t1 = evergreen.spawn(waiter1)
+            evergreen.spawn(waiter2)
+            evergreen.sleep(0.01)
+            # Ownership goes to waiter1, which is killed before it can run
+            t1.kill()
+            lock.release()
+        evergreen.spawn(runner)
+        self.loop.run()
+        self.assertTrue(d.acquired)
+
     def test_bounded_semaphore(self):
         def func():
             lock = locks.BoundedSemaphore()
@@ -52,6 +120,86 @@ class LocksTests(EvergreenTestCase):
         evergreen.spawn(func2)
         self.loop.run()
 
+    def test_condition_notify_one(self):
+        d = dummy()
+        d.woken = []
+        cond = locks.Condition()
+        def waiter(x):
+            with cond:
+                cond.wait()
+                d.woken.append(x)
+        def notifier():
+            evergreen.sleep(0.01)
+            with cond:
+                cond.notify()
+            evergreen.sleep(0.01)
+            self.assertEqual(d.woken, [0])
+            with cond:
+                cond.notify_all()
+        for x in range(3):
+            evergreen.spawn(waiter, x)
+        evergreen.spawn(notifier)
+        self.loop.run()
+        self.assertEqual(d.woken, [0, 1, 2])
+
+    def test_wait_queue_timeout(self):
+        queue = locks.WaitQueue()
+        def waiter():
+            self.assertFalse(queue.wait(0.01))
+        def notifier():
+            evergreen.sleep(0.02)
+            self.assertEqual(len(queue), 0)
+            self.assertEqual(queue.notify(), 0)
+        for x in range(100):
+            evergreen.spawn(waiter)
+        evergreen.spawn(notifier)
+        self.loop.run()
+        self.assertEqual(len(queue._waiters), 0)
+
+    def test_wait_queue_pass_on(self):
+        d = dummy()
+        d.value = None
+        queue = locks.WaitQueue()
+        def waiter2():
+            d.value = queue.wait()
+        def runner():
+            t1 = evergreen.spawn(queue.wait)
+            evergreen.spawn(waiter2)
+            evergreen.sleep(0.01)
+            t1.kill()
+            self.assertEqual(queue.notify(1, 42), 1)
+        evergreen.spawn(runner)
+        self.loop.run()
+        self.assertEqual(d.value, 42)
+
+    def test_result(self):
+        d = dummy()
+        d.value = None
+        result = Result()
+        def waiter():
+            with result:
+                evergreen.current.loop.call_later(0.01, result.set_value, 42)
+                d.value = result.get()
+        evergreen.spawn(waiter)
+        self.loop.run()
+        self.assertEqual(d.value, 42)
+
+    def test_result_timeout(self):
+        d = dummy()
+        d.value = None
+        result = Result()
+        def waiter():
+            with result:
+                self.assertRaises(Timeout, result.get, 0.01)
+            # a late value is discarded and does not affect the next user
+            result.set_value(1)
+            with result:
+                evergreen.current.loop.call_soon(result.set_value, 2)
+                d.value = result.get(1)
+        evergreen.spawn(waiter)
+        self.loop.run()
+        self.assertEqual(d.value, 2)
+
     def test_barrier(self):
         num_tasks = 10
         d = dummy()
@@ -4,6 +4,7 @@ from common import dummy, unittest, EvergreenTestCase
 import evergreen
 import signal
 import threading
+import time
 
 from six.moves import queue
 
@@ -62,6 +63,15 @@ class LoopTests(EvergreenTestCase):
         self.loop.run()
         self.assertTrue(d.called)
 
+    def test_call_soon_args(self):
+        d = dummy()
+        d.called = None
+        def func(*args, **kw):
+            d.called = (args, kw)
+        self.loop.call_soon(func, 1, 2, foo='bar')
+        self.loop.run()
+        self.assertEqual(d.called, ((1, 2), {'foo': 'bar'}))
+
     def test_call_soon_cancel(self):
         d = dummy()
         d.called = False
@@ -72,6 +82,56 @@ class LoopTests(EvergreenTestCase):
         self.loop.run()
         self.assertFalse(d.called)
 
+    def test_ready_budget_count(self):
+        d = dummy()
+        d.called = 0
+        def func():
+            d.called += 1
+        self.loop.set_ready_budget(max_count=3)
+        for x in range(10):
+            self.loop.call_soon(func)
+        self.loop.run()
+        self.assertEqual(d.called, 10)
+        stats = self.loop.ready_stats
+        self.assertEqual(stats.processed, 10)
+        self.assertEqual(stats.iterations, 4)
+        self.assertEqual(stats.last_processed, 1)
+        self.assertEqual(stats.deferred, 7+4+1)
+
+    def test_ready_budget_time(self):
+        d = dummy()
+        d.called = 0
+        def func():
+            d.called += 1
+            time.sleep(0.02)
+        self.loop.set_ready_budget(max_time=0.01)
+        for x in range(3):
+            self.loop.call_soon(func)
+        self.loop.run()
+        self.assertEqual(d.called, 3)
+        # every callback exceeds the budget on its own
+        stats = self.loop.ready_stats
+        self.assertEqual(stats.iterations, 3)
+        self.assertEqual(stats.last_processed, 1)
+
+    def test_ready_budget_skip_cancelled(self):
+        d = dummy()
+        d.called = 0
+        def func():
+            d.called += 1
+        self.loop.set_ready_budget(max_count=2)
+        handlers = [self.loop.call_soon(func) for x in range(4)]
+        handlers[0].cancel()
+        handlers[1].cancel()
+        self.loop.run()
+        self.assertEqual(d.called, 2)
+        self.assertEqual(self.loop.ready_stats.iterations, 1)
+        self.assertEqual(self.loop.ready_stats.skipped, 2)
+
+    def test_ready_budget_invalid(self):
+        self.assertRaises(ValueError, self.loop.set_ready_budget, 0)
+        self.assertRaises(ValueError, self.loop.set_ready_budget, None, -1)
+
     def test_call_later(self):
         d = dummy()
         d.called = False
@@ -103,6 +163,30 @@ class LoopTests(EvergreenTestCase):
         self.loop.run()
         self.assertFalse(d.called)
 
+    def test_call_later_order(self):
+        d = dummy()
+        d.called = []
+        for delay in (0.05, 0.01, 0.03, 0.02, 0.04):
+            self.loop.call_later(delay, d.called.append, delay)
+        self.loop.run()
+        self.assertEqual(d.called, [0.01, 0.02, 0.03, 0.04, 0.05])
+
+    def test_call_later_cancel_many(self):
+        d = dummy()
+        d.called = []
+        handlers = [self.loop.call_later(0.01+x*0.0001, d.called.append, x) for x in range(500)]
+        for h in handlers[:400]:
+            h.cancel()
+        self.loop.run()
+        self.assertEqual(d.called, list(range(400, 500)))
+
+    def test_call_later_cancel_exit(self):
+        h = self.loop.call_later(100, lambda: None)
+        h.cancel()
+        t0 = self.loop.time()
+        self.loop.run()
+        self.assertTrue(self.loop.time() - t0 < 0.1)
+
     def test_call_at(self):
         d = dummy()
         d.called = False
@@ -231,6 +315,11 @@ class LoopTests(EvergreenTestCase):
         evergreen.spawn(func)
         self.loop.run()
 
+    def test_destroy_wakeup_fd(self):
+        self.loop.destroy()
+        self.assertEqual(signal.set_wakeup_fd(-1), -1)
+        self.loop = evergreen.EventLoop()
+
     def test_reuse_handler(self):
         handler = self.loop.call_later(1, lambda: None)
         self.assertRaises(AssertionError, self.loop.call_later, 1, handler)
@@ -0,0 +1,84 @@
+
+from common import dummy, unittest, EvergreenTestCase
+
+import os
+import signal
+import sys
+
+import evergreen
+from evergreen.io import process
+
+
+class ProcessTests(EvergreenTestCase):
+
+    def test_communicate(self):
+        def func():
+            p = process.Process(['cat'], stdin=process.PIPE, stdout=process.PIPE)
+            self.assertTrue(p.pid > 0)
+            out, err = p.communicate(b'hello')
+            self.assertEqual((out, err), (b'hello', None))
+            self.assertEqual(p.returncode, 0)
+            self.assertIsNone(p.pid)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_communicate_streaming(self):
+        d = dummy()
+        d.size = 0
+        d.chunks = 0
+        def on_stdout(data):
+            d.size += len(data)
+            d.chunks += 1
+        def func():
+            p = process.Process(['cat'], stdin=process.PIPE, stdout=process.PIPE, stderr=process.PIPE)
+            chunks = (b'x' * 65536 for x in range(64))
+            out, err = p.communicate(chunks, stdout_callback=on_stdout)
+            self.assertEqual((out, err), (None, b''))
+            self.assertEqual(p.wait(), 0)
+        evergreen.spawn(func)
+        self.loop.run()
+        self.assertEqual(d.size, 64 * 65536)
+        self.assertTrue(d.chunks > 1)
+
+    def test_exit_code(self):
+        def func():
+            p = process.Process([sys.executable, '-c', 'import sys; sys.stderr.write("oops"); sys.exit(3)'],
+                                stdout=process.DEVNULL, stderr=process.PIPE)
+            self.assertEqual(p.communicate(), (None, b'oops'))
+            self.assertEqual(p.returncode, 3)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_wait_timeout_signal(self):
+        def func():
+            p = process.Process(['sleep', '10'])
+            self.assertIsNone(p.wait(timeout=0.01))
+            self.assertIsNone(p.poll())
+            p.terminate()
+            self.assertEqual(p.wait(timeout=5), -signal.SIGTERM)
+            # signals are not sent to processes which already exited
+            p.kill()
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_spawn_error(self):
+        def func():
+            self.assertRaises(process.ProcessError, process.Process, ['/nonexistent/program'], stdout=process.PIPE)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_fd_redirection(self):
+        r, w = os.pipe()
+        def func():
+            with process.Process(['echo', 'hi'], stdout=w) as p:
+                pass
+            self.assertEqual(p.returncode, 0)
+        evergreen.spawn(func)
+        self.loop.run()
+        os.close(w)
+        self.assertEqual(os.read(r, 100), b'hi\n')
+        os.close(r)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+
+from common import dummy, unittest, EvergreenTestCase
+
+import socket
+
+import evergreen
+from evergreen.core.resolver import _LRUCache, _interleave_addrinfos
+from evergreen.lib import socket as green_socket
+
+
+class ResolverTests(EvergreenTestCase):
+
+    def test_numeric_host(self):
+        def func():
+            r = green_socket.getaddrinfo('127.0.0.1', 80, 0, socket.SOCK_STREAM)
+            self.assertEqual(r[0][-1], ('127.0.0.1', 80))
+            self.assertEqual(green_socket.gethostbyname('127.0.0.1'), '127.0.0.1')
+            self.assertEqual(self.loop.resolver.misses, 0)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_cache(self):
+        resolver = self.loop.resolver
+        def func():
+            r1 = green_socket.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+            r2 = green_socket.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+            self.assertEqual(r1, r2)
+            self.assertEqual((resolver.hits, resolver.misses), (1, 1))
+            resolver.ttl = 0.01
+            resolver.clear()
+            green_socket.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+            evergreen.sleep(0.02)
+            green_socket.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+            self.assertEqual((resolver.hits, resolver.misses), (1, 3))
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_negative_cache(self):
+        resolver = self.loop.resolver
+        def func():
+            self.assertRaises(socket.gaierror, green_socket.getaddrinfo, 'evergreen.invalid', 80)
+            self.assertRaises(socket.gaierror, green_socket.getaddrinfo, 'evergreen.invalid', 80)
+            self.assertEqual((resolver.hits, resolver.misses), (1, 1))
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_coalesce(self):
+        resolver = self.loop.resolver
+        d = dummy()
+        d.results = []
+        def func():
+            d.results.append(green_socket.gethostbyname('localhost'))
+        for x in range(5):
+            evergreen.spawn(func)
+        self.loop.run()
+        self.assertEqual(len(d.results), 5)
+        self.assertEqual(len(set(d.results)), 1)
+        self.assertEqual((resolver.misses, resolver.coalesced), (1, 4))
+
+    def test_prewarm(self):
+        resolver = self.loop.resolver
+        def func():
+            resolver.prewarm([('localhost', 80), ('127.0.0.1', 80)])
+            evergreen.sleep(0.1)
+            self.assertEqual(resolver.misses, 1)
+            green_socket.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+            self.assertEqual(resolver.hits, 1)
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_lru(self):
+        cache = _LRUCache(2)
+        cache.set('a', 1, None, 10)
+        cache.set('b', 2, None, 10)
+        self.assertEqual(cache.get('a', 0).value, 1)
+        cache.set('c', 3, None, 10)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b', 0))
+        self.assertEqual(cache.get('c', 0).value, 3)
+        self.assertIsNone(cache.get('a', 10))
+        self.assertEqual(len(cache), 1)
+
+    def test_interleave(self):
+        infos = [(socket.AF_INET6, 1), (socket.AF_INET6, 2), (socket.AF_INET6, 3), (socket.AF_INET, 4)]
+        self.assertEqual([x[1] for x in _interleave_addrinfos(infos)], [1, 4, 2, 3])
+        self.assertEqual(_interleave_addrinfos([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,165 @@
+
+from common import dummy, unittest, EvergreenTestCase
+
+import errno
+import io
+import os
+import socket as std_socket
+import tempfile
+
+import evergreen
+from evergreen.lib import select, socket
+
+
+class SocketTests(EvergreenTestCase):
+
+    def _socketpair(self):
+        a, b = std_socket.socketpair()
+        return socket.socket(_sock=a), socket.socket(_sock=b)
+
+    def test_recv_wait(self):
+        a, b = self._socketpair()
+        d = dummy()
+        d.data = []
+        def reader():
+            for x in range(3):
+                d.data.append(a.recv(10))
+        def writer():
+            for x in range(3):
+                evergreen.sleep(0.01)
+                b.sendall(b'x')
+        evergreen.spawn(reader)
+        evergreen.spawn(writer)
+        self.loop.run()
+        self.assertEqual(d.data, [b'x', b'x', b'x'])
+        # the same poll handle is used for all waits, and it's stopped when idle
+        fd = a.fileno()
+        poll_h = self.loop._fd_map[fd]
+        self.assertFalse(poll_h.active)
+        a.close()
+        b.close()
+        self.assertNotIn(fd, self.loop._fd_map)
+
+    def test_recv_timeout(self):
+        a, b = self._socketpair()
+        def func():
+            a.settimeout(0.01)
+            self.assertRaises(socket.timeout, a.recv, 10)
+            self.assertFalse(self.loop._fd_map[a.fileno()].active)
+            b.sendall(b'x')
+            self.assertEqual(a.recv(10), b'x')
+            a.close()
+            b.close()
+        evergreen.spawn(func)
+        self.loop.run()
+
+    def test_close_while_waiting(self):
+        a, b = self._socketpair()
+        d = dummy()
+        d.error = None
+        def reader():
+            try:
+                a.recv(10)
+            except socket.error as e:
+                d.error = e
+        def closer():
+            a.close()
+            b.close()
+        evergreen.spawn(reader)
+        evergreen.spawn(closer)
+        self.loop.run()
+        self.assertEqual(d.error.args[0], errno.EBADF)
+
+    def test_recv_then_select(self):
+        a, b = self._socketpair()
+        d = dummy()
+        def reader():
+            # select uses the same poll handle as the socket's own waits
+            d.data = a.recv(1)
+            d.result = select.select([a], [], [], 1)
+            a.close()
+            b.close()
+        def writer():
+            evergreen.sleep(0.01)
+            b.sendall(b'xy')
+        evergreen.spawn(reader)
+        evergreen.spawn(writer)
+        self.loop.run()
+        self.assertEqual(d.data, b'x')
+        self.assertEqual(d.result, ([a], [], []))
+
+    def _read_all(self, sock, nbytes, d):
+        data = []
+        received = 0
+        while received < nbytes:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data.append(chunk)
+            received += len(chunk)
+        d.data = b''.join(data)
+
+    def test_sendall(self):
+        a, b = self._socketpair()
+        payload = os.urandom(1024*1024)
+        d = dummy()
+        def writer():
+            a.sendall(payload)
+        evergreen.spawn(writer)
+        evergreen.spawn(self._read_all, b, len(payload), d)
+        self.loop.run()
+        self.assertEqual(d.data, payload)
+        a.close()
+        b.close()
+
+    def test_sendall_buffers(self):
+        a, b = self._socketpair()
+        buffers = [os.urandom(1000 + x) for x in range(2000)]
+        payload = b''.join(buffers)
+        d = dummy()
+        def writer():
+            a.sendall(buffers)
+            self.assertEqual(a.sendmsg([b'a', b'b']), 2)
+        evergreen.spawn(writer)
+        evergreen.spawn(self._read_all, b, len(payload) + 2, d)
+        self.loop.run()
+        self.assertEqual(d.data, payload + b'ab')
+        a.close()
+        b.close()
+
+    def test_sendall_large_buffers(self):
+        a, b = self._socketpair()
+        # every item is too large to be sent at once
+        buffers = [os.urandom(1024*1024), bytearray(os.urandom(1024*1024)), b'end']
+        payload = b''.join(bytes(x) for x in buffers)
+        d = dummy()
+        evergreen.spawn(a.sendall, buffers)
+        evergreen.spawn(self._read_all, b, len(payload), d)
+        self.loop.run()
+        self.assertEqual(d.data, payload)
+        a.close()
+        b.close()
+
+    def test_sendfile(self):
+        a, b = self._socketpair()
+        payload = os.urandom(1024*1024)
+        f = tempfile.TemporaryFile()
+        f.write(payload)
+        d = dummy()
+        def writer():
+            self.assertEqual(a.sendfile(f), len(payload))
+            self.assertEqual(f.tell(), len(payload))
+            self.assertEqual(a.sendfile(f, offset=10, count=100), 100)
+            self.assertEqual(f.tell(), 110)
+            self.assertEqual(a.sendfile(io.BytesIO(payload), offset=5, count=10), 10)
+        evergreen.spawn(writer)
+        evergreen.spawn(self._read_all, b, len(payload) + 110, d)
+        self.loop.run()
+        f.close()
+        self.assertEqual(d.data, payload + payload[10:110] + payload[5:15])
+        a.close()
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,125 @@
+
+from common import dummy, unittest, EvergreenTestCase
+
+import os
+import shutil
+import tempfile
+
+import evergreen
+from evergreen.io import watch
+
+
+class WatchTests(EvergreenTestCase):
+
+    def setUp(self):
+        super(WatchTests, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'config.txt')
+        with open(self.path, 'w') as f:
+            f.write('a')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(WatchTests, self).tearDown()
+
+    def test_watch_debounce(self):
+        d = dummy()
+        d.batches = []
+        watcher = watch.FSWatcher(self.dir, debounce=0.05)
+        def consumer():
+            for changes in watcher:
+                d.batches.append(changes)
+        def producer():
+            # a burst of changes is reported at once
+            for x in range(20):
+                with open(self.path, 'a') as f:
+                    f.write('x')
+                evergreen.sleep(0.001)
+            os.rename(self.path, self.path + '.new')
+            evergreen.sleep(0.2)
+            with open(os.path.join(self.dir, 'other.txt'), 'w') as f:
+                f.write('y')
+            evergreen.sleep(0.2)
+            watcher.close()
+        evergreen.spawn(consumer)
+        evergreen.spawn(producer)
+        self.loop.run()
+        self.assertEqual(len(d.batches), 2)
+        changes = dict(d.batches[0])
+        self.assertTrue(changes['config.txt'] & watch.FSWatcher.CHANGE)
+        self.assertTrue(changes['config.txt.new'] & watch.FSWatcher.RENAME)
+        self.assertEqual([x[0] for x in d.batches[1]], ['other.txt'])
+
+    def test_watch_max_delay(self):
+        d = dummy()
+        d.batches = []
+        def func():
+            watcher = watch.FSWatcher(self.dir, debounce=0.05, max_delay=0.1)
+            t0 = self.loop.time()
+            while self.loop.time() - t0 < 0.3:
+                with open(self.path, 'a') as f:
+                    f.write('x')
+                evergreen.sleep(0.01)
+                changes = watcher.get(timeout=0)
+                if changes:
+                    d.batches.append(changes)
+            watcher.close()
+            changes = watcher.get()
+            self.assertEqual(changes, [])
+            changes.append('x')
+            self.assertEqual(watcher.get(), [])
+        evergreen.spawn(func)
+        self.loop.run()
+        # changes never stop for 50ms, but they are still handed out every 100ms
+        self.assertTrue(len(d.batches) >= 2)
+
+    def test_poll(self):
+        d = dummy()
+        def func():
+            poller = watch.FSPoller(self.path, interval=0.05, debounce=0.01)
+            self.assertIsNone(poller.get(timeout=0.1))
+            with open(self.path, 'a') as f:
+                f.write('xyz')
+            prev, curr = poller.get(timeout=2)
+            self.assertEqual((prev.st_size, curr.st_size), (1, 4))
+            os.unlink(self.path)
+            prev, curr = poller.get(timeout=2)
+            self.assertEqual((prev.st_size, curr), (4, None))
+            poller.close()
+            # the file is removed before it ever changed
+            other = os.path.join(self.dir, 'other.txt')
+            with open(other, 'w') as f:
+                f.write('abc')
+            poller = watch.FSPoller(other, interval=0.05, debounce=0.01)
+            os.unlink(other)
+            prev, curr = poller.get(timeout=2)
+            self.assertEqual((prev.st_size, curr), (3, None))
+            poller.close()
+            d.done = True
+        evergreen.spawn(func)
+        self.loop.run()
+        self.assertTrue(d.done)
+
+    def test_poll_outside_task(self):
+        d = dummy()
+        poller = watch.FSPoller(self.path, interval=0.05, debounce=0.01)
+        def func():
+            os.unlink(self.path)
+            d.changes = poller.get(timeout=2)
+            poller.close()
+        evergreen.spawn(func)
+        self.loop.run()
+        prev, curr = d.changes
+        self.assertEqual((prev.st_size, curr), (1, None))
+
+    def test_invalid(self):
+        def func():
+            self.assertRaises(ValueError, watch.FSWatcher, self.dir, debounce=-1)
+            self.assertRaises(ValueError, watch.FSWatcher, self.dir, debounce=2, max_delay=1)
+            self.assertRaises(watch.FSEventError, watch.FSWatcher, os.path.join(self.dir, 'missing'))
+        evergreen.spawn(func)
+        self.loop.run()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)